@@ -1,8 +1,24 @@
-from ui import DungeonListenerApp
-import customtkinter as ctk
-
-if __name__ == "__main__":
-    ctk.set_appearance_mode("dark")
-    ctk.set_default_color_theme("blue")
-    app = DungeonListenerApp()
-    app.mainloop()
\ No newline at end of file
+import time
+
+start_time = time.perf_counter()
+
+from ui import DungeonListenerApp
+import customtkinter as ctk
+import events
+
+import_seconds = time.perf_counter() - start_time
+
+def report_startup(event):
+    if event.widget is not app:
+        return
+    app.unbind("<Map>")
+    window_seconds = time.perf_counter() - start_time
+    events.emit("startup", import_seconds=import_seconds, window_seconds=window_seconds)
+    print(f"[app] Imports took {import_seconds:.2f} seconds, window shown after {window_seconds:.2f} seconds.")
+
+if __name__ == "__main__":
+    ctk.set_appearance_mode("dark")
+    ctk.set_default_color_theme("blue")
+    app = DungeonListenerApp()
+    app.bind("<Map>", report_startup)
+    app.mainloop()
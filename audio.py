@@ -0,0 +1,112 @@
+import hashlib
+import os
+import pathlib
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+import events
+
+SAMPLE_RATE = 16000
+cache_dir = pathlib.Path.home() / ".dungeon-scribe" / "audio-cache"
+# Decoded copies are ~230 MB per hour of audio. Runs remove their own, so
+# anything this old was left by a crash.
+stale_after_s = 24 * 3600
+
+def decode_stream(audio_path, block_s=30):
+    """Decode any ffmpeg-readable file to 16 kHz mono float32, one block at a time"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", str(audio_path),
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    block_bytes = int(block_s * SAMPLE_RATE) * 2
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            if len(data) % 2:
+                data += process.stdout.read(1)
+            yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {audio_path}")
+
+def cache_key(audio_path):
+    stat = os.stat(audio_path)
+    identity = f"{os.path.abspath(audio_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+class AudioSource:
+    """16 kHz mono samples of a recording, backed by a memory-mapped float32 cache file"""
+
+    def __init__(self, audio_path):
+        self.audio_path = str(audio_path)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_path = cache_dir / f"{cache_key(audio_path)}.f32"
+        if not self.cache_path.exists():
+            _remove_stale()
+            with events.span("decode"):
+                self._decode_to_cache()
+        if self.cache_path.stat().st_size == 0:
+            self.samples = np.zeros(0, dtype=np.float32)
+        else:
+            # Copy-on-write so torch.from_numpy accepts the array without copying the file.
+            self.samples = np.memmap(self.cache_path, dtype=np.float32, mode="c")
+
+    def _decode_to_cache(self):
+        print(f"[audio] Decoding {self.audio_path} to {self.cache_path}")
+        start_time = time.time()
+        tmp_path = self.cache_path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.part")
+        try:
+            with open(tmp_path, "wb") as f:
+                for block in decode_stream(self.audio_path):
+                    f.write(block.tobytes())
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        print(f"[audio] Decoded in {time.time() - start_time:.2f} seconds.")
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def duration(self):
+        return len(self.samples) / SAMPLE_RATE
+
+    def read(self, start_s, end_s):
+        return self.samples[int(start_s * SAMPLE_RATE):int(end_s * SAMPLE_RATE)]
+
+    def windows(self, length_s):
+        start = 0.0
+        while start < self.duration:
+            end = min(start + length_s, self.duration)
+            yield start, self.read(start, end)
+            start = end
+
+def open_samples(cache_path, start_sample, end_sample):
+    samples = np.memmap(cache_path, dtype=np.float32, mode="c")
+    return samples[start_sample:end_sample]
+
+def discard(audio_path):
+    """Delete the decoded copy of a recording once nothing needs its samples any more"""
+    try:
+        (cache_dir / f"{cache_key(audio_path)}.f32").unlink(missing_ok=True)
+    except OSError as e:
+        # Windows refuses while another job still has the file mapped; it goes
+        # with the next clean-up instead.
+        print(f"[audio] Could not remove the decoded copy of {audio_path}: {e}")
+
+def _remove_stale():
+    cutoff = time.time() - stale_after_s
+    for path in list(cache_dir.glob("*.f32")) + list(cache_dir.glob("*.part")):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,61 @@
+import torch
+
+MODELS = ["tiny", "base", "small", "medium", "large-v2", "large-v3", "distil-large-v3"]
+
+def select_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def supported_compute_types(device):
+    try:
+        import ctranslate2
+        return set(ctranslate2.get_supported_compute_types(device))
+    except Exception:
+        return {"float16", "int8_float16", "int8", "float32"} if device == "cuda" else {"int8", "float32"}
+
+def default_compute_type(device):
+    # int8 weights are the fastest CTranslate2 path on CPU; on GPU float16 keeps
+    # the accuracy of float32 at roughly half the memory.
+    preferred = ["float16", "int8_float16", "int8"] if device == "cuda" else ["int8", "float32"]
+    supported = supported_compute_types(device)
+    for compute_type in preferred:
+        if compute_type in supported:
+            return compute_type
+    return "float32"
+
+def default_batch_size(device):
+    return 16 if device == "cuda" else 8
+
+class InferenceConfig:
+    """Model, device and precision for one job; "auto" fields are resolved for this machine"""
+
+    def __init__(self, model="large-v2", device="auto", compute_type="auto", batch_size=None):
+        self.device = select_device() if device in (None, "auto") else device
+        self.compute_type = default_compute_type(self.device) if compute_type in (None, "auto") else compute_type
+        if self.compute_type not in supported_compute_types(self.device):
+            raise ValueError(f"compute type {self.compute_type} is not supported on {self.device}")
+        self.model = model
+        self.batch_size = batch_size or default_batch_size(self.device)
+
+    @property
+    def cache_name(self):
+        return f"{self.model}_{self.compute_type}"
+
+    def __repr__(self):
+        return f"InferenceConfig(model={self.model!r}, device={self.device!r}, compute_type={self.compute_type!r}, batch_size={self.batch_size})"
+
+def candidate_configs(device=None, models=None, compute_types=None):
+    """Configurations to calibrate
+
+    By default each model is tried at the device's default precision and one
+    alternative (int8 on GPU, float32 on CPU), since every configuration costs
+    a full model load.
+    """
+    device = device or select_device()
+    supported = supported_compute_types(device)
+    if compute_types is None:
+        compute_types = {default_compute_type(device), "int8" if device == "cuda" else "float32"} & supported
+    configs = []
+    for model in models or ["small", "medium", "distil-large-v3", "large-v2"]:
+        for compute_type in sorted(compute_types):
+            configs.append(InferenceConfig(model, device, compute_type))
+    return configs
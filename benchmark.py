@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import json
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+import types
+import wave
+
+import numpy as np
+
+import audio
+import cache
+import metrics
+import models
+import pipeline
+import transcription
+from audio import SAMPLE_RATE
+
+STAGES = ["decode", "vad", "model_load", "transcribe", "align", "diarize", "assign_speakers", "speaker_fix", "export"]
+
+def synthetic_audio(path, duration_s, seed=0):
+    """Write a reproducible session-like WAV: speech-shaped noise bursts, short pauses and long breaks"""
+    rng = np.random.default_rng(seed)
+    total = int(duration_s * SAMPLE_RATE)
+    samples = rng.normal(0, 0.002, total).astype(np.float32)
+    t = 0.0
+    while t < duration_s:
+        if rng.random() < 0.01:
+            t += rng.uniform(20, 60)
+            continue
+        burst = rng.uniform(1.0, 8.0)
+        start, end = int(t * SAMPLE_RATE), min(total, int((t + burst) * SAMPLE_RATE))
+        envelope = np.abs(np.sin(np.linspace(0, np.pi * burst * 4, end - start)))
+        samples[start:end] += (rng.normal(0, 0.2, end - start) * envelope).astype(np.float32)
+        t += burst + rng.uniform(0.3, 3.0)
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return path
+
+class StandInWhisper:
+    def __init__(self, rtf):
+        self.rtf = rtf
+
+    def transcribe(self, samples, batch_size=16, language=None):
+        duration = len(samples) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+        segments = []
+        for start in np.arange(0, duration, 5.0):
+            end = min(start + 5.0, duration)
+            segments.append({"start": float(start), "end": float(end), "text": f" stand-in words at {start:.0f} seconds"})
+        return {"segments": segments, "language": language}
+
+class StandInAligner:
+    def __init__(self, rtf):
+        self.rtf = rtf
+
+    def __call__(self, segments, model, metadata, samples, device, return_char_alignments=False):
+        time.sleep(len(samples) / SAMPLE_RATE * self.rtf)
+        aligned = []
+        for segment in segments:
+            words = segment["text"].split()
+            step = (segment["end"] - segment["start"]) / max(1, len(words))
+            aligned.append(dict(segment, words=[
+                {"word": word, "start": segment["start"] + i * step, "end": segment["start"] + (i + 1) * step, "score": 0.9}
+                for i, word in enumerate(words)
+            ]))
+        return {"segments": aligned}
+
+class StandInDiarizer:
+    def __init__(self, rtf, speakers=4):
+        self.rtf = rtf
+        self.speakers = speakers
+
+    def __call__(self, samples, min_speakers=None, max_speakers=None, return_embeddings=False):
+        import pandas as pd
+        duration = len(samples) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+        speakers = min(self.speakers, max_speakers or self.speakers)
+        turns = [
+            {"start": float(start), "end": float(min(start + 7.0, duration)), "speaker": f"SPEAKER_{int(start // 7) % speakers:02d}"}
+            for start in np.arange(0, duration, 7.0)
+        ]
+        df = pd.DataFrame(turns, columns=["start", "end", "speaker"])
+        embeddings = {f"SPEAKER_{i:02d}": list(np.eye(speakers)[i]) for i in range(speakers)}
+        return (df, embeddings) if return_embeddings else df
+
+@contextlib.contextmanager
+def patched(target, **attributes):
+    """Set attributes on target for the duration of the block, then restore them"""
+    originals = {name: getattr(target, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(target, name, value)
+
+@contextlib.contextmanager
+def stand_ins(rtf):
+    """Serve stand-in models through the normal model registry instead of whisperx's downloads"""
+    stand_in_whisperx = types.SimpleNamespace(
+        load_model=lambda *args, **kwargs: StandInWhisper(rtf),
+        load_align_model=lambda *args, **kwargs: (None, {}),
+        align=StandInAligner(rtf / 4),
+        diarize=types.SimpleNamespace(DiarizationPipeline=lambda *args, **kwargs: StandInDiarizer(rtf / 2)),
+    )
+    # Real and stand-in models must never be served from the same registry.
+    models.unload_models()
+    try:
+        with patched(models, whisperx=stand_in_whisperx):
+            yield
+    finally:
+        models.unload_models()
+
+def run(duration_s, stand_in, stand_in_rtf, token, seed):
+    work_dir = pathlib.Path(tempfile.mkdtemp(prefix="dungeon-bench-"))
+    try:
+        with contextlib.ExitStack() as stack:
+            # Each run decodes and transcribes from scratch so the numbers are comparable.
+            stack.enter_context(patched(audio, cache_dir=work_dir / "audio-cache"))
+            stack.enter_context(patched(cache, cache_dir=work_dir / "cache"))
+            if stand_in:
+                stack.enter_context(stand_ins(stand_in_rtf))
+            audio_path = synthetic_audio(work_dir / "session.wav", duration_s, seed)
+            metrics.reset()
+            start_time = time.perf_counter()
+            try:
+                pipeline.run_pipeline(str(audio_path), token or "stand-in", "benchmark", 3, open_file=False, output_dir=work_dir)
+            finally:
+                wall = time.perf_counter() - start_time
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    stages = metrics.snapshot()
+    return {
+        "audio_seconds": duration_s,
+        "wall_seconds": round(wall, 4),
+        "rtf": round(wall / duration_s, 6),
+        "peak_rss_bytes": metrics.peak_rss_bytes(),
+        "model_load_seconds": stages.get("model_load", {}).get("seconds", 0.0),
+        "stages": {stage: stages[stage] for stage in STAGES if stage in stages},
+        "stand_in": stand_in,
+        "config": repr(transcription.current_config()),
+    }
+
+def compare(report, baseline, tolerance):
+    """Regressions where a timing got slower than the baseline by more than tolerance"""
+    regressions = []
+    checks = [("rtf", report["rtf"], baseline.get("rtf"), 0.0)]
+    for stage, values in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base:
+            # Stages that take a few milliseconds are mostly noise, so they
+            # must also slow down by an absolute 10ms to count.
+            checks.append((stage, values["seconds"], base["seconds"], 0.01))
+    for name, current, base, floor in checks:
+        if base is not None and current > base * (1 + tolerance) and current - base > floor:
+            regressions.append({"metric": name, "baseline": base, "current": current, "change": round(current / base - 1, 4) if base else None})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transcription pipeline on synthetic audio.")
+    parser.add_argument("--duration", type=float, default=600, help="seconds of synthetic audio (default: 600)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stand-in", action="store_true", help="use stand-in models so the run works offline")
+    parser.add_argument("--stand-in-rtf", type=float, default=0.0, help="simulated real-time factor of the stand-in transcriber")
+    parser.add_argument("--token", help="HuggingFace token for real diarization runs")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare against a previous report and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown against the baseline (default: 0.15)")
+    args = parser.parse_args(argv)
+
+    report = run(args.duration, args.stand_in, args.stand_in_rtf, args.token, args.seed)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        status = 1 if report["regressions"] else 0
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+    print(output)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import copy
+import threading
+
+import events
+import metrics
+import models
+
+GB = 2**30
+
+# Rough resident sizes used to plan before anything has been measured.
+MODEL_PARAMS = {
+    "tiny": 39e6, "base": 74e6, "small": 244e6, "medium": 769e6,
+    "large-v2": 1550e6, "large-v3": 1550e6, "distil-large-v3": 756e6,
+}
+BYTES_PER_PARAM = {"float32": 4, "float16": 2, "int8_float16": 1, "int8": 1}
+ALIGN_BYTES = 1.3 * GB
+DIARIZE_BYTES = 1.0 * GB
+# Activations per batched 30 s window for a large model; smaller models scale down.
+BATCH_ITEM_BYTES = 0.25 * GB
+# Decoded samples plus the copies and features whisper makes of a chunk.
+CHUNK_BYTES_PER_S = 16000 * 4 * 4
+
+min_chunk_s = 30
+high_water = 0.9
+
+# Runs in progress; they share the process and so the limit.
+_running = 0
+_running_lock = threading.Lock()
+
+class MemoryBudget:
+    """Keeps the process under limit_bytes of resident memory
+
+    The limit is for the whole process: parallel runs each hold a budget with
+    the same limit, and each plans with an equal share of the headroom. Chunk
+    length and batch size are planned from rough model sizes before the
+    run. The batch size is then halved whenever measured RSS crosses high_water
+    of the limit, and the transcription models are unloaded before diarization
+    if both would not fit.
+
+    The run reports its own stages through measure(), so runs in parallel
+    never record each other's stages.
+    """
+
+    def __init__(self, limit_bytes, file=None):
+        self.limit = limit_bytes
+        self.file = file
+        self.choices = {}
+        self.stage_rss = {}
+        self.peak = metrics.current_rss_bytes()
+        self._lock = threading.Lock()
+        self._done = False
+        global _running
+        with _running_lock:
+            _running += 1
+
+    def measure(self, stage):
+        """Record resident memory at the end of one of this run's stages"""
+        rss = metrics.current_rss_bytes()
+        with self._lock:
+            self.stage_rss[stage] = max(rss, self.stage_rss.get(stage, 0))
+            self.peak = max(self.peak, rss)
+
+    def plan(self, inference, chunk_length_s):
+        """A copy of inference and a chunk length sized for the budget"""
+        inference = copy.copy(inference)
+        loaded = {key[0] for key in models.loaded_models()}
+        params = MODEL_PARAMS.get(inference.model, MODEL_PARAMS["large-v2"])
+        fixed = metrics.current_rss_bytes()
+        if "whisper" not in loaded:
+            fixed += params * BYTES_PER_PARAM.get(inference.compute_type, 4)
+        if "align" not in loaded:
+            fixed += ALIGN_BYTES
+        with _running_lock:
+            runs = max(_running, 1)
+        headroom = (self.limit * high_water - fixed) / runs
+        per_item = BATCH_ITEM_BYTES * max(params / MODEL_PARAMS["large-v2"], 0.1)
+
+        def need(batch, chunk):
+            return batch * per_item + chunk * CHUNK_BYTES_PER_S
+
+        batch = inference.batch_size
+        chunk = chunk_length_s
+        while batch > 1 and need(batch, chunk) > headroom:
+            batch //= 2
+        while chunk > min_chunk_s and need(batch, chunk) > headroom:
+            chunk = max(min_chunk_s, chunk // 2)
+        if need(batch, chunk) > headroom:
+            print(f"[budget] Warning: {inference.model} ({inference.compute_type}) probably needs more than {self.limit / GB:.1f} GB; try a smaller model or int8.")
+        inference.batch_size = batch
+        self.choices.update(chunk_length_s=chunk, batch_size=batch, planned_batch_size=batch)
+        events.emit("budget_plan", file=self.file, limit=self.limit, chunk_length_s=chunk, batch_size=batch)
+        print(f"[budget] Limit {self.limit / GB:.1f} GB: {chunk}s chunks, batch size {batch}.")
+        return inference, chunk
+
+    def check(self, inference):
+        """Halve the batch size when measured RSS is close to the limit"""
+        rss = metrics.current_rss_bytes()
+        with self._lock:
+            self.peak = max(self.peak, rss)
+        if rss > self.limit * high_water and inference.batch_size > 1:
+            inference.batch_size //= 2
+            self.choices["batch_size"] = inference.batch_size
+            events.emit("budget_adjust", file=self.file, rss=rss, batch_size=inference.batch_size)
+            print(f"[budget] RSS {rss / GB:.1f} GB is near the limit, batch size lowered to {inference.batch_size}.")
+
+    def make_room_for_diarization(self):
+        """Unload the transcription models if they and the diarization model won't fit together"""
+        loaded = {key[0] for key in models.loaded_models()}
+        needed = 0 if "diarize" in loaded else DIARIZE_BYTES
+        if metrics.current_rss_bytes() + needed <= self.limit * high_water:
+            return False
+        unloaded = models.unload_models("whisper") + models.unload_models("align")
+        self.choices["unloaded_before_diarization"] = unloaded > 0
+        return unloaded > 0
+
+    def report(self):
+        """The run's choices and memory; also ends the run's share of the limit"""
+        global _running
+        with _running_lock:
+            if not self._done:
+                self._done = True
+                _running -= 1
+        return dict(self.choices, limit=self.limit, peak_rss=self.peak, stage_rss=dict(self.stage_rss))
+
+def describe(report):
+    parts = [f"budget {report['limit'] / GB:.1f} GB"]
+    if "chunk_length_s" in report:
+        parts.append(f"{report['chunk_length_s']}s chunks")
+    if "batch_size" in report:
+        batch = report["batch_size"]
+        planned = report.get("planned_batch_size", batch)
+        parts.append(f"batch {planned}" if planned == batch else f"batch {planned}->{batch}")
+    if report.get("unloaded_before_diarization"):
+        parts.append("unloaded transcription models before diarization")
+    parts.append(f"peak {report['peak_rss'] / GB:.1f} GB")
+    return ", ".join(parts)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import pathlib
+import re
+import threading
+
+cache_dir = pathlib.Path.home() / ".dungeon-scribe" / "cache"
+_hashes = {}
+
+def file_hash(path):
+    """Content hash of a file, memoized per (path, size, mtime) for this process"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+def _safe(value):
+    return re.sub(r"[^\w.-]", "_", str(value))
+
+def _json_default(value):
+    if getattr(value, "ndim", 0):
+        return value.tolist()
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+def audio_dir(audio_hash):
+    return cache_dir / audio_hash
+
+def preview_dir():
+    """Where speaker-less previews of running transcriptions go, out of the user's transcripts folder"""
+    folder = cache_dir / "previews"
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+def read_json(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_json(path, data):
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique per writer, since server workers may finish the same recording at once.
+    tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}-{threading.get_ident()}.part")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, default=_json_default)
+    os.replace(tmp_path, path)
+
+def chunk_path(audio_hash, start, end, model, language):
+    return audio_dir(audio_hash) / "chunks" / f"{start:.2f}-{end:.2f}_{_safe(model)}_{_safe(language)}.json"
+
+def load_chunk(audio_hash, start, end, model, language):
+    return read_json(chunk_path(audio_hash, start, end, model, language))
+
+def save_chunk(audio_hash, start, end, model, language, segments):
+    write_json(chunk_path(audio_hash, start, end, model, language), segments)
+
+def diarization_path(audio_hash, settings):
+    return audio_dir(audio_hash) / f"diarization_{_safe(settings)}.json"
+
+def load_diarization(audio_hash, settings):
+    return read_json(diarization_path(audio_hash, settings))
+
+def save_diarization(audio_hash, settings, turns, embeddings):
+    write_json(diarization_path(audio_hash, settings), {"turns": turns, "embeddings": embeddings})
+
+def _key_default(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, "__dict__"):
+        return {"type": type(value).__name__, **vars(value)}
+    return _json_default(value)
+
+def artifact_key(stage, version, *parts):
+    """Digest of everything a stage's output depends on: its version, upstream artifact keys and its own settings"""
+    data = json.dumps([stage, version, *parts], sort_keys=True, default=_key_default)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+def artifact_path(audio_hash, stage, key):
+    return audio_dir(audio_hash) / "artifacts" / f"{_safe(stage)}_{key}.json"
+
+def load_artifact(audio_hash, stage, key):
+    return read_json(artifact_path(audio_hash, stage, key))
+
+def save_artifact(audio_hash, stage, key, data):
+    write_json(artifact_path(audio_hash, stage, key), data)
+
+def clear(audio_hash=None):
+    import shutil
+    target = audio_dir(audio_hash) if audio_hash else cache_dir
+    if target.exists():
+        shutil.rmtree(target)
@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+import time
+
+import backend
+import models
+from audio import AudioSource, discard
+
+def word_error_rate(reference, hypothesis):
+    ref = reference.lower().split()
+    hyp = hypothesis.lower().split()
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+def measure(inference, samples, duration, language):
+    models.unload_models("whisper")
+    start_time = time.time()
+    model = models.get_whisper_model(inference.model, language, inference.device, inference.compute_type)
+    load_time = time.time() - start_time
+    start_time = time.time()
+    result = models.transcribe(model, samples, inference.batch_size, language)
+    transcribe_time = time.time() - start_time
+    text = " ".join(segment["text"].strip() for segment in result["segments"])
+    return {
+        "model": inference.model,
+        "device": inference.device,
+        "compute_type": inference.compute_type,
+        "batch_size": inference.batch_size,
+        "load_seconds": round(load_time, 2),
+        "transcribe_seconds": round(transcribe_time, 2),
+        "rtf": round(transcribe_time / duration, 4) if duration else None,
+        "text": text,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure speed and accuracy of inference configurations on a reference clip.")
+    parser.add_argument("clip", help="reference audio clip, a few minutes is plenty")
+    parser.add_argument("--reference", help="text file with the correct transcript; word error rate is only reported with one")
+    parser.add_argument("--models", nargs="+", help="models to try (default: small medium distil-large-v3 large-v2)")
+    parser.add_argument("--compute-types", nargs="+",
+                        help="precisions to try, or 'all' for every supported one (default: the device's default and int8 on GPU or float32 on CPU)")
+    parser.add_argument("--device", default="auto", help="cpu, cuda or auto (default: auto)")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    source = AudioSource(args.clip)
+    samples = source.read(0, source.duration)
+    device = backend.select_device() if args.device == "auto" else args.device
+    compute_types = args.compute_types
+    if compute_types == ["all"]:
+        compute_types = backend.supported_compute_types(device)
+    rows = []
+    for inference in backend.candidate_configs(device, args.models, compute_types):
+        print(f"[calibrate] Measuring {inference}")
+        try:
+            rows.append(measure(inference, samples, source.duration, args.language))
+        except Exception as e:
+            print(f"[calibrate] Skipping {inference.model}/{inference.compute_type}: {e}")
+    models.unload_models("whisper")
+    discard(args.clip)
+    if not rows:
+        print("[calibrate] No configuration could be measured.")
+        return 1
+
+    # Without a reference there is no ground truth: comparing against another
+    # configuration would only reward agreeing with it.
+    if args.reference:
+        with open(args.reference, "r") as f:
+            reference = f.read()
+        for row in rows:
+            row["wer"] = round(word_error_rate(reference, row["text"]), 4)
+
+    print(f"[calibrate] {source.duration:.1f}s clip on {device}:")
+    print(f"{'model':<18}{'compute':<14}{'load s':>8}{'RTF':>8}{'WER':>8}")
+    for row in sorted(rows, key=lambda row: row["rtf"] or 0):
+        rtf = "n/a" if row["rtf"] is None else f"{row['rtf']:.3f}"
+        wer = f"{row['wer']:.1%}" if "wer" in row else "n/a"
+        print(f"{row['model']:<18}{row['compute_type']:<14}{row['load_seconds']:>8.1f}{rtf:>8}{wer:>8}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import time
+
+import config
+import exporters
+
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        for match in matches:
+            if os.path.isfile(match) and match not in files:
+                files.append(match)
+    return files
+
+def formats(value):
+    try:
+        return exporters.resolve_formats(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="dungeon-scribe", description="Transcribe and diarize recordings without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="audio files or glob patterns (quote globs to use recursive **)")
+    parser.add_argument("--format", type=formats, default="md",
+                        help=f"transcript formats, comma-separated: {', '.join(exporters.FORMATS)} (default: md)")
+    parser.add_argument("--name", help="transcript base file name; with several inputs it prefixes each audio file's name (default: the audio file's name)")
+    parser.add_argument("--output-dir", help="where transcripts are written (default: ~/Documents/transcriptions)")
+    parser.add_argument("--token", help="HuggingFace token (default: the one saved by the GUI)")
+    parser.add_argument("--language", default="en", help="spoken language code (default: en)")
+    parser.add_argument("--min-speakers", type=int, help="lower bound on the number of speakers")
+    parser.add_argument("--max-speakers", type=int, help="upper bound on the number of speakers")
+    parser.add_argument("--model", default="large-v2", help="Whisper model, e.g. small, large-v2, distil-large-v3 (default: large-v2)")
+    parser.add_argument("--device", default="auto", help="cpu, cuda or auto (default: auto)")
+    parser.add_argument("--compute-type", default="auto", help="float32, float16, int8, int8_float16 or auto (default: auto)")
+    parser.add_argument("--batch-size", type=int, help="transcription batch size (default: chosen for the device)")
+    parser.add_argument("--processes", type=int, default=1, help="on CPU, transcribe chunks in this many worker processes, each with its own models (default: 1)")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="CPU threads for each worker's models; keep processes x threads near the core count (default: library defaults)")
+    parser.add_argument("--memory-budget", type=float, help="resident memory limit in GB for the whole process, shared by --jobs; chunk length and batch size adapt to stay under it")
+    parser.add_argument("--jobs", type=int, default=1, help="files processed at the same time; they share the models, which run one call at a time, so only different stages overlap (default: 1)")
+    parser.add_argument("--diarize-window", type=float, help="diarize long recordings in windows of this many seconds and link the speakers across them, bounding diarization memory (default: whole recording at once)")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="longest pause, in seconds, an unknown line may follow a known speaker by (default: 5)")
+    parser.add_argument("--look-ahead", type=int, default=2, help="lines to look ahead for the next known speaker (default: 2)")
+    parser.add_argument("--roster", help="comma-separated player and character names to look for in introductions")
+    parser.add_argument("--trace", help="append structured pipeline events to this JSONL file")
+    parser.add_argument("--chrome-trace", help="write a Chrome trace of the run to this file (open in Perfetto or chrome://tracing)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    token = args.token or os.environ.get("HF_TOKEN") or config.load_token()
+    if not token:
+        print("[cli] Error: HuggingFace token not set. Pass --token, set HF_TOKEN or save one from the GUI.", file=sys.stderr)
+        return 2
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("[cli] Error: no audio files matched.", file=sys.stderr)
+        return 2
+
+    # Imported late so --help and argument errors don't pay for loading torch.
+    import backend
+    import budget
+    import diarization
+    import diarize
+    import events
+    import pipeline
+    import transcription
+    try:
+        inference = backend.InferenceConfig(args.model, args.device, args.compute_type, args.batch_size)
+    except ValueError as e:
+        print(f"[cli] Error: {e}", file=sys.stderr)
+        return 2
+    print(f"[cli] Using {inference}")
+    transcription.process_workers = max(1, args.processes)
+    transcription.threads_per_worker = max(0, args.threads_per_worker)
+    if args.memory_budget:
+        transcription.memory_budget_bytes = int(args.memory_budget * budget.GB)
+    if args.diarize_window:
+        diarization.window_s = args.diarize_window
+    if args.roster:
+        diarize.roster = [name.strip() for name in args.roster.split(",") if name.strip()]
+
+    def run(audio_path):
+        file_name = os.path.splitext(os.path.basename(audio_path))[0]
+        if args.name:
+            # With several inputs --name becomes a prefix, so jobs never share a name.
+            file_name = f"{args.name}-{file_name}" if len(files) > 1 else args.name
+        return pipeline.run_pipeline(audio_path, token, file_name, args.format, open_file=False,
+                                     output_dir=args.output_dir, language=args.language,
+                                     min_speakers=args.min_speakers, max_speakers=args.max_speakers,
+                                     inference=inference,
+                                     unknown_options={"max_gap_seconds": args.max_gap, "look_ahead": args.look_ahead})
+
+    events.subscribe(events.console_printer)
+    memory = {}
+    events.subscribe(lambda event: memory.__setitem__(event["file"], event) if event["type"] == "budget" else None)
+    recorded = []
+    if args.chrome_trace:
+        events.subscribe(recorded.append)
+    trace = events.JsonlTrace(args.trace) if args.trace else None
+
+    print(f"[cli] Processing {len(files)} file(s), {args.jobs} at a time.")
+    start_time = time.time()
+    statuses = {}
+    # Models live in a process-wide cache, so every file after the first reuses them.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(run, audio_path): audio_path for audio_path in files}
+        for future in concurrent.futures.as_completed(futures):
+            audio_path = futures[future]
+            try:
+                statuses[audio_path] = (0, ", ".join(str(path) for path in future.result().values()))
+            except Exception as e:
+                statuses[audio_path] = (1, f"{type(e).__name__}: {e}")
+
+    if trace:
+        trace.close()
+    if args.chrome_trace:
+        with open(args.chrome_trace, "w") as f:
+            json.dump(events.to_chrome_trace(recorded), f, default=str)
+        print(f"[cli] Chrome trace written to {args.chrome_trace}")
+
+    print(f"[cli] Summary ({time.time() - start_time:.2f} seconds):")
+    for audio_path in files:
+        status, detail = statuses[audio_path]
+        print(f"[cli] {'ok    ' if status == 0 else 'FAILED'} {audio_path} -> {detail}")
+        if audio_path in memory:
+            print(f"[cli]        {budget.describe(memory[audio_path])}")
+    return 1 if any(status for status, _ in statuses.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import os
+import pathlib
+import threading
+
+config_dir = pathlib.Path.home() / ".dungeon-scribe"
+config_file = config_dir / "config"
+
+def _read():
+    settings = {}
+    if config_file.exists():
+        with open(config_file, "r") as f:
+            for line in f:
+                if "=" in line:
+                    key, value = line.strip().split("=", 1)
+                    settings[key] = value
+    return settings
+
+def load_setting(key, default=None):
+    return _read().get(key, default)
+
+def save_setting(key, value):
+    settings = _read()
+    settings[key] = value
+    config_dir.mkdir(exist_ok=True)
+    # Written aside and swapped in, so a job reading the token at the same
+    # moment never sees a half-written file.
+    tmp_path = config_file.with_name(f"{config_file.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    with open(tmp_path, "w") as f:
+        for name, setting in settings.items():
+            f.write(f"{name}={setting}\n")
+    os.replace(tmp_path, config_file)
+
+def load_token():
+    return load_setting("hf_token")
+
+def save_token(token):
+    save_setting("hf_token", token)
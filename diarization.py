@@ -0,0 +1,266 @@
+import time
+
+import numpy as np
+
+import cache
+import models
+from audio import SAMPLE_RATE
+
+window_s = 0
+link_threshold = 0.5
+
+def run_pipeline(token, audio, device, min_speakers=None, max_speakers=None):
+    pipeline = models.get_diarize_pipeline(token, device)
+    # np.asarray gives a plain ndarray view of the memory-mapped samples, which
+    # torch wraps without copying. The pipeline is shared by every job, so
+    # calls into it take its inference lock like Whisper and the aligner.
+    with models.inference_lock(pipeline):
+        diarize_df, speaker_embeddings = pipeline(np.asarray(audio), min_speakers=min_speakers,
+                                                  max_speakers=max_speakers, return_embeddings=True)
+    turns = [
+        {"start": float(row.start), "end": float(row.end), "speaker": str(row.speaker)}
+        for row in diarize_df.itertuples()
+    ]
+    embeddings = {speaker: [float(v) for v in vector] for speaker, vector in (speaker_embeddings or {}).items()}
+    return turns, embeddings
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-8)
+
+def speaker_durations(turns):
+    durations = {}
+    for turn in turns:
+        durations[turn["speaker"]] = durations.get(turn["speaker"], 0.0) + turn["end"] - turn["start"]
+    return durations
+
+def recluster(turns, embeddings, max_speakers):
+    """Merge the most similar speakers until at most max_speakers remain"""
+    durations = speaker_durations(turns)
+    labels = [speaker for speaker in durations if speaker in embeddings]
+    if len(labels) <= max_speakers:
+        return turns
+    centroids = {speaker: np.asarray(embeddings[speaker], dtype=np.float32) for speaker in labels}
+    mapping = {speaker: speaker for speaker in durations}
+    while len(labels) > max_speakers:
+        unit = _normalize([centroids[speaker] for speaker in labels])
+        similarity = unit @ unit.T
+        np.fill_diagonal(similarity, -np.inf)
+        i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+        keep, drop = labels[i], labels[j]
+        if durations[drop] > durations[keep]:
+            keep, drop = drop, keep
+        total = durations[keep] + durations[drop]
+        centroids[keep] = (centroids[keep] * durations[keep] + centroids[drop] * durations[drop]) / total
+        durations[keep] = total
+        for speaker, target in mapping.items():
+            if target == drop:
+                mapping[speaker] = keep
+        labels.remove(drop)
+    print(f"[diarization] Re-clustered {len(mapping)} speakers down to {len(labels)}.")
+    return [dict(turn, speaker=mapping[turn["speaker"]]) for turn in turns]
+
+def _link_window(global_labels, centroids, durations, window_turns, window_embeddings):
+    local_durations = speaker_durations(window_turns)
+    candidates = []
+    for speaker in local_durations:
+        if speaker not in window_embeddings:
+            continue
+        vector = _normalize([window_embeddings[speaker]])[0]
+        for label in centroids:
+            candidates.append((float(vector @ _normalize([centroids[label]])[0]), speaker, label))
+    # Greedy one-to-one matching: two speakers in the same window are never
+    # collapsed into one global speaker.
+    mapping = {}
+    used = set()
+    for similarity, speaker, label in sorted(candidates, reverse=True):
+        if similarity < link_threshold or speaker in mapping or label in used:
+            continue
+        mapping[speaker] = label
+        used.add(label)
+    for speaker in sorted(local_durations, key=local_durations.get, reverse=True):
+        vector = window_embeddings.get(speaker)
+        if speaker not in mapping:
+            label = f"SPEAKER_{len(global_labels):02d}"
+            global_labels.append(label)
+            mapping[speaker] = label
+            if vector is not None:
+                centroids[label] = np.asarray(vector, dtype=np.float32)
+                durations[label] = local_durations[speaker]
+        elif vector is not None:
+            label = mapping[speaker]
+            weight = local_durations[speaker]
+            total = durations[label] + weight
+            centroids[label] = (centroids[label] * durations[label] + np.asarray(vector, dtype=np.float32) * weight) / total
+            durations[label] = total
+    return [dict(turn, speaker=mapping[turn["speaker"]]) for turn in window_turns]
+
+def run_windowed(token, audio, device, length_s, max_speakers=None):
+    """Diarize bounded windows and link their speakers into one session-wide set of labels
+
+    Windows run one after another: they share one pyannote pipeline, which is
+    not known to be safe to call from several threads.
+    """
+    window_len = int(length_s * SAMPLE_RATE)
+    bounds = [(start, min(start + window_len, len(audio))) for start in range(0, len(audio), window_len)]
+    print(f"[diarization] Diarizing {len(bounds)} windows of {length_s:.0f}s.")
+
+    global_labels = []
+    centroids = {}
+    durations = {}
+    all_turns = []
+    for start, end in bounds:
+        window_turns, window_embeddings = run_pipeline(token, audio[start:end], device, max_speakers=max_speakers)
+        offset = start / SAMPLE_RATE
+        for turn in window_turns:
+            turn["start"] += offset
+            turn["end"] += offset
+        all_turns.extend(_link_window(global_labels, centroids, durations, window_turns, window_embeddings))
+    embeddings = {label: [float(v) for v in centroids[label]] for label in centroids}
+    print(f"[diarization] Linked windows into {len(global_labels)} speakers.")
+    return all_turns, embeddings
+
+def _merge(starts, ends):
+    """Sorted intervals with the overlapping ones merged"""
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > np.maximum.accumulate(ends)[:-1]
+    return starts[first], np.maximum.reduceat(ends, np.flatnonzero(first))
+
+def _ranges(first, count):
+    """Owner and index of every element of the ranges [first, first + count)"""
+    owner = np.repeat(np.arange(len(first)), count)
+    offsets = np.cumsum(count) - count
+    return owner, np.repeat(first - offsets, count) + np.arange(count.sum())
+
+def _timeline(by_speaker):
+    """Every speaker's turns in one table sorted by start, labelled with the speaker's index
+
+    The turn boundaries cut the timeline into pieces, and covering lists the
+    turns over each piece (offsets[k]:offsets[k + 1] for piece k). A speaker's
+    merged turns never overlap each other, so a piece lists at most one turn per
+    speaker.
+    """
+    starts, ends, labels = [], [], []
+    for label, turns in enumerate(by_speaker.values()):
+        merged_starts, merged_ends = _merge(np.array([turn["start"] for turn in turns], dtype=np.float64),
+                                            np.array([turn["end"] for turn in turns], dtype=np.float64))
+        starts.append(merged_starts)
+        ends.append(merged_ends)
+        labels.append(np.full(len(merged_starts), label))
+    starts, ends, labels = np.concatenate(starts), np.concatenate(ends), np.concatenate(labels)
+    order = np.argsort(starts, kind="stable")
+    starts, ends, labels = starts[order], ends[order], labels[order]
+    bounds = np.unique(np.concatenate((starts, ends)))
+    first = np.searchsorted(bounds, starts)
+    turn, piece = _ranges(first, np.searchsorted(bounds, ends) - first)
+    order = np.argsort(piece, kind="stable")
+    offsets = np.searchsorted(piece[order], np.arange(len(bounds) + 1))
+    return starts, ends, labels, bounds, turn[order], offsets
+
+def _assign(items, speakers, timeline):
+    if not items:
+        return
+    starts, ends, labels, bounds, covering, offsets = timeline
+    start = np.array([item["start"] for item in items], dtype=np.float64)
+    # Zero-length words still get the speaker talking at that instant.
+    end = np.maximum(np.array([item["end"] for item in items], dtype=np.float64), start + 1e-3)
+
+    # An item overlaps the turns covering its start and the turns that begin
+    # inside it, and no others; the two sets never share a turn.
+    piece = np.searchsorted(bounds, start, side="right") - 1
+    row = np.maximum(piece, 0)
+    at_start, covering_index = _ranges(offsets[row], np.where(piece >= 0, offsets[row + 1] - offsets[row], 0))
+    first_inside = np.searchsorted(starts, start, side="right")
+    inside, turn = _ranges(first_inside, np.searchsorted(starts, end) - first_inside)
+    owner = np.concatenate((at_start, inside))
+    turn = np.concatenate((covering[covering_index], turn))
+    seconds = np.minimum(end[owner], ends[turn]) - np.maximum(start[owner], starts[turn])
+    label = labels[turn]
+
+    # Seconds per (item, speaker), then the speaker with the most; ties go to
+    # the speaker that appeared first.
+    best = np.zeros(len(items))
+    best_label = np.zeros(len(items), dtype=np.int64)
+    total = np.zeros(len(items))
+    if len(owner):
+        order = np.lexsort((label, owner))
+        owner, label, seconds = owner[order], label[order], seconds[order]
+        heads = np.flatnonzero(np.concatenate(([True], (owner[1:] != owner[:-1]) | (label[1:] != label[:-1]))))
+        owner, label, seconds = owner[heads], label[heads], np.add.reduceat(seconds, heads)
+        total = np.bincount(owner, seconds, minlength=len(items))
+        order = np.lexsort((label, -seconds, owner))
+        winners = order[np.concatenate(([True], owner[order][1:] != owner[order][:-1]))]
+        best[owner[winners]] = seconds[winners]
+        best_label[owner[winners]] = label[winners]
+    # Share of the item covered by the winner: low for items mostly in silence
+    # or split between speakers.
+    confidence = best / np.maximum(np.maximum(end - start, total), 1e-9)
+    for item, speaker_id, seconds, score in zip(items, best_label.tolist(), best.tolist(), confidence.tolist()):
+        if seconds > 0:
+            item["speaker"] = speakers[speaker_id]
+            item["speaker_confidence"] = round(score, 3)
+        else:
+            item.pop("speaker", None)
+            item.pop("speaker_confidence", None)
+
+def assign_word_speakers(turns, result):
+    """Label segments and timed words with the speaker whose turns overlap them most
+
+    All speakers' turns share one sorted timeline, so finding the turns that
+    overlap an item takes binary searches over it, whatever the number of
+    speakers: O((W + T) log T) plus one step per overlapping turn. Every label
+    comes with a speaker_confidence between 0 and 1.
+    """
+    by_speaker = {}
+    for turn in turns:
+        by_speaker.setdefault(turn["speaker"], []).append(turn)
+    segments = result["segments"]
+    if not by_speaker:
+        return result
+    speakers = list(by_speaker)
+    timeline = _timeline(by_speaker)
+    _assign(segments, speakers, timeline)
+    words = [word for segment in segments for word in segment.get("words", []) if "start" in word and "end" in word]
+    _assign(words, speakers, timeline)
+    return result
+
+def diarize(token, audio, device, audio_hash=None, min_speakers=None, max_speakers=None):
+    """Diarization turns for a recording, reusing cached segmentation and embeddings when possible"""
+    start_time = time.time()
+    windowed = window_s and len(audio) > window_s * SAMPLE_RATE
+    base_settings = f"window{int(window_s)}" if windowed else "base"
+    cached = cache.load_diarization(audio_hash, base_settings) if audio_hash else None
+    if cached is None:
+        print("[diarization] Running diarization pipeline on audio.")
+        if windowed:
+            turns, embeddings = run_windowed(token, audio, device, window_s)
+        else:
+            turns, embeddings = run_pipeline(token, audio, device)
+        if audio_hash:
+            cache.save_diarization(audio_hash, base_settings, turns, embeddings)
+    else:
+        print(f"[diarization] Using cached diarization for {audio_hash[:12]}.")
+        turns, embeddings = cached["turns"], cached["embeddings"]
+
+    found = len(speaker_durations(turns))
+    if max_speakers and found > max_speakers:
+        turns = recluster(turns, embeddings, max_speakers)
+    elif min_speakers and found < min_speakers and windowed:
+        print(f"[diarization] Found {found} speakers, fewer than min_speakers={min_speakers}; windowed mode cannot split speakers.")
+    elif min_speakers and found < min_speakers:
+        # Clusters can be merged from cache but not split, so fewer speakers
+        # than requested needs a constrained pass of its own.
+        settings = f"min{min_speakers}-max{max_speakers}"
+        cached = cache.load_diarization(audio_hash, settings) if audio_hash else None
+        if cached is None:
+            print(f"[diarization] Running diarization with {settings} speakers.")
+            turns, embeddings = run_pipeline(token, audio, device, min_speakers, max_speakers)
+            if audio_hash:
+                cache.save_diarization(audio_hash, settings, turns, embeddings)
+        else:
+            turns = cached["turns"]
+    print(f"[diarization] {len(turns)} turns from {len(speaker_durations(turns))} speakers in {time.time() - start_time:.2f} seconds.")
+    return turns
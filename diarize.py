@@ -1,136 +1,156 @@
+import collections
 import re
+import string
 
-def extract_name_from_text(text):
-    """Extract name from various introduction patterns"""
+EXCLUDED_WORDS = frozenset({
+    'good', 'bad', 'fine', 'okay', 'worried', 'excited', 'happy', 'sad',
+    'tired', 'busy', 'ready', 'done', 'sorry', 'here', 'back', 'late',
+    'early', 'sick', 'well', 'hungry', 'thirsty', 'cold', 'hot', 'dead',
+    'alive', 'free', 'lost', 'found', 'sure', 'confused', 'interested',
+    'bored', 'angry', 'calm', 'nervous', 'confident', 'available',
+    'working', 'thinking', 'looking', 'trying', 'going', 'coming'
+})
+
+# (pattern, confidence, name must be capitalized). Each pattern has exactly one
+# capturing group so match.lastgroup says which one fired.
+_PATTERNS = [
+    # "My name is [Name]" - most reliable
+    (r"\bmy name is\s+(?P<n0>\w+(?:\s+\w+)?)", 0.9, False),
+    # "I'm [Name]" / "I am [Name]" but only if Name is capitalized and not common word
+    (r"\bi'm\s+(?P<n1>\w+)", 0.7, True),
+    (r"\bi am\s+(?P<n2>\w+)", 0.7, True),
+    # "This is [Name]"
+    (r"\bthis is\s+(?P<n3>\w+)", 0.8, True),
+    # "[Name] speaking/here"
+    (r"^(?P<n4>\w+)\s+(?:speaking|here)", 0.8, True),
+    # "Call me [Name]"
+    (r"\bcall me\s+(?P<n5>\w+)", 0.8, False),
+]
+_NAME_PATTERN = re.compile("|".join(pattern for pattern, _, _ in _PATTERNS), re.IGNORECASE)
+_RULES = {f"n{i}": (confidence, capitalized) for i, (_, confidence, capitalized) in enumerate(_PATTERNS)}
+_WORD = re.compile(r"\w+")
+_END = None
+
+MIN_CONFIDENCE = 0.6
+ROSTER_BONUS = 0.2
+
+roster = []
+
+class NameRoster:
+    """Trie over the words of known player and character names, matched case-insensitively"""
+
+    def __init__(self, names=()):
+        self.root = {}
+        self.depth = 0
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        tokens = _WORD.findall(name.lower())
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[_END] = name.strip()
+        self.depth = max(self.depth, len(tokens))
+
+    def match(self, text, pos=0):
+        """Longest roster name starting at text[pos], or None"""
+        node = self.root
+        found = None
+        for i, token in enumerate(_WORD.finditer(text, pos)):
+            if i == self.depth or (i == 0 and token.start() != pos):
+                break
+            node = node.get(token.group().lower())
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return found
+
+    def __bool__(self):
+        return bool(self.root)
+
+def find_names(text, known=None):
+    """All (name, confidence) self-introductions in text"""
     text = text.strip()
-    
-    # Pattern 1: "My name is [Name]"
-    match = re.search(r'\bmy name is\s+(\w+)', text, re.IGNORECASE)
-    if match:
-        return match.group(1)
-    
-    # Pattern 2: "I'm [Name]" or "I am [Name]" 
-    # But exclude common adjectives/emotions
-    excluded_words = {
-        'good', 'bad', 'fine', 'okay', 'worried', 'excited', 'happy', 'sad',
-        'tired', 'busy', 'ready', 'done', 'sorry', 'here', 'back', 'late',
-        'early', 'sick', 'well', 'hungry', 'thirsty', 'cold', 'hot', 'dead',
-        'alive', 'free', 'busy', 'lost', 'found', 'sure', 'confused',
-        'interested', 'bored', 'angry', 'calm', 'nervous', 'confident'
-    }
-    
-    # Look for "I'm [word]" or "I am [word]" at start of sentence
-    match = re.search(r'\b(?:i\'m|i am)\s+(\w+)', text, re.IGNORECASE)
-    if match:
-        potential_name = match.group(1).lower()
-        # Only accept if it's not a common adjective and looks like a name
-        if (potential_name not in excluded_words and 
-            potential_name[0].isupper() in text):  # Check if originally capitalized
-            return match.group(1)
-    
-    # Pattern 3: "This is [Name]" or "It's [Name]"
-    match = re.search(r'\b(?:this is|it\'s)\s+(\w+)', text, re.IGNORECASE)
-    if match:
-        potential_name = match.group(1).lower()
-        if potential_name not in excluded_words:
-            return match.group(1)
-    
-    # Pattern 4: "[Name] speaking" or "[Name] here"
-    match = re.search(r'^(\w+)\s+(?:speaking|here)', text, re.IGNORECASE)
-    if match:
-        return match.group(1)
-    
-    return None
+    found = []
+    for match in _NAME_PATTERN.finditer(text):
+        group = match.lastgroup
+        confidence, capitalized = _RULES[group]
+        name = known.match(text, match.start(group)) if known else None
+        if name:
+            found.append((name, min(1.0, confidence + ROSTER_BONUS)))
+            continue
+        name = clean_name(match.group(group))
+        if not name or name.split()[0].lower() in EXCLUDED_WORDS:
+            continue
+        if capitalized and not name[0].isupper():
+            continue
+        if confidence > MIN_CONFIDENCE:
+            found.append((name, confidence))
+    return found
+
+def extract_name_advanced(text, known=None):
+    best = max(find_names(text, known), key=lambda item: item[1], default=None)
+    return best[0] if best else None
 
 def clean_name(name):
     if not name:
         return name
-    
-    import string
+
     name = name.strip(string.punctuation + string.whitespace)
-    
+
     separators = [',', '.', '!', '?', ';', ':']
     for sep in separators:
         if sep in name:
             name = name.split(sep)[0].strip()
             break
-    
+
     return name
 
-def update_speaker_names(result):
-    speaker_map = {}
-    speaker_lines = {}
-    
-    for segment in result["segments"]:
-        speaker = segment.get("speaker", "Unknown")
-        if speaker not in speaker_lines:
-            speaker_lines[speaker] = []
-        speaker_lines[speaker].append(segment)
-    
-    for speaker, segments in speaker_lines.items():
-        found = False
-        for segment in segments[:10]:
-            text = segment.get("text", "")
-            name = extract_name_advanced(text)
-            if name:
-                cleaned_name = clean_name(name)
-                if cleaned_name: 
-                    speaker_map[speaker] = cleaned_name
-                    found = True
-                    break
-        
-        if not found:
-            speaker_map[speaker] = speaker
-    
-    for segment in result["segments"]:
-        speaker = segment.get("speaker", "Unknown")
-        segment["speaker"] = speaker_map.get(speaker, speaker)
-
-def extract_name_advanced(text):
-    text = text.strip()
-    
-    patterns = [
-        # "My name is [Name]" - most reliable
-        (r'\bmy name is\s+(\w+(?:\s+\w+)?)', 0.9),
-        
-        # "I'm [Name]" but only if Name is capitalized and not common word
-        (r'\bi\'m\s+([A-Z]\w+)', 0.7),
-        
-        # "I am [Name]" with same conditions
-        (r'\bi am\s+([A-Z]\w+)', 0.7),
-        
-        # "This is [Name]" 
-        (r'\bthis is\s+([A-Z]\w+)', 0.8),
-        
-        # "[Name] speaking/here"
-        (r'^([A-Z]\w+)\s+(?:speaking|here)', 0.8),
-        
-        # "Call me [Name]"
-        (r'\bcall me\s+(\w+)', 0.8),
-    ]
-    
-    excluded_words = {
-        'good', 'bad', 'fine', 'okay', 'worried', 'excited', 'happy', 'sad',
-        'tired', 'busy', 'ready', 'done', 'sorry', 'here', 'back', 'late',
-        'early', 'sick', 'well', 'hungry', 'thirsty', 'cold', 'hot', 'dead',
-        'alive', 'free', 'lost', 'found', 'sure', 'confused', 'interested', 
-        'bored', 'angry', 'calm', 'nervous', 'confident', 'available',
-        'working', 'thinking', 'looking', 'trying', 'going', 'coming'
-    }
-    
-    best_match = None
-    best_confidence = 0
-    
-    for pattern, confidence in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            potential_name = match.group(1).strip()
-            
-            if potential_name.lower() in excluded_words:
-                continue
-                
-            if confidence > best_confidence:
-                best_match = potential_name
-                best_confidence = confidence
-    
-    return best_match if best_confidence > 0.6 else None
\ No newline at end of file
+def speaker_name_map(lines, known=None):
+    """Map speaker labels to names from (speaker, text) lines
+
+    Every line counts: a name's score is the sum of its match confidences over
+    the speaker's lines. Names are then handed out best score first, so two
+    labels never end up with the same name.
+    """
+    scores = collections.defaultdict(collections.Counter)
+    spellings = collections.defaultdict(collections.Counter)
+    speakers = set()
+    for speaker, text in lines:
+        speakers.add(speaker)
+        for name, confidence in find_names(text, known):
+            scores[speaker][name.lower()] += confidence
+            spellings[name.lower()][name] += 1
+
+    candidates = sorted(
+        ((score, speaker, key) for speaker, counter in scores.items() for key, score in counter.items()),
+        key=lambda item: -item[0],
+    )
+    speaker_map = {speaker: speaker for speaker in speakers}
+    named = set()
+    used = set()
+    for score, speaker, key in candidates:
+        # "Unknown" collects lines from several people, so it keeps its label.
+        if speaker == "Unknown" or speaker in named or key in used:
+            continue
+        speaker_map[speaker] = spellings[key].most_common(1)[0][0]
+        named.add(speaker)
+        used.add(key)
+    return speaker_map
+
+def update_speaker_names(transcript, names=None):
+    """Replace speaker labels with introduced names; names is a roster of known names (default: roster)"""
+    speaker_map = find_speaker_names(transcript, names)
+    apply_speaker_names(transcript, speaker_map)
+    return speaker_map
+
+def find_speaker_names(transcript, names=None):
+    known = NameRoster(roster if names is None else names)
+    return speaker_name_map(((speaker, text) for speaker, _, _, text in transcript.rows()), known)
+
+def apply_speaker_names(transcript, speaker_map):
+    # Only the interned speaker table changes; segment and word ids stay put.
+    transcript.rename_speakers(speaker_map)
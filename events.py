@@ -0,0 +1,134 @@
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+from timefmt import format_time
+
+_subscribers = []
+_lock = threading.Lock()
+
+def subscribe(callback):
+    """Call callback(event) for every event; returns a function that unsubscribes it"""
+    with _lock:
+        _subscribers.append(callback)
+
+    def unsubscribe():
+        with _lock:
+            if callback in _subscribers:
+                _subscribers.remove(callback)
+    return unsubscribe
+
+def emit(event_type, **fields):
+    event = {"type": event_type, "ts": time.time(), "pid": os.getpid(), "tid": threading.get_ident()}
+    event.update(fields)
+    with _lock:
+        subscribers = list(_subscribers)
+    for callback in subscribers:
+        try:
+            callback(event)
+        except Exception as e:
+            # A broken sink must never take the pipeline down with it.
+            print(f"[events] Subscriber failed on {event_type}: {e}")
+    return event
+
+@contextlib.contextmanager
+def span(name, **fields):
+    start = time.time()
+    start_perf = time.perf_counter()
+    emit("span_start", name=name, **fields)
+    try:
+        yield
+    finally:
+        emit("span_end", name=name, start=start, duration=time.perf_counter() - start_perf, **fields)
+
+class EtaEstimator:
+    """Remaining time from a moving average of the last few completion intervals"""
+
+    def __init__(self, total, window=5):
+        self.total = total
+        self.done = 0
+        self.intervals = collections.deque(maxlen=window)
+        self.last = None
+
+    def update(self, done=None):
+        # The clock starts at the first completion, so model loading and
+        # warm-up before it never count as a chunk interval.
+        now = time.time()
+        if self.last is not None:
+            self.intervals.append(now - self.last)
+        self.last = now
+        self.done = self.done + 1 if done is None else done
+        return self.eta
+
+    @property
+    def average(self):
+        if not self.intervals:
+            return None
+        return sum(self.intervals) / len(self.intervals)
+
+    @property
+    def eta(self):
+        if not self.intervals:
+            return None
+        return self.average * max(0, self.total - self.done)
+
+class JsonlTrace:
+    """Subscriber that appends every event to a JSON Lines file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+        self._unsubscribe = subscribe(self)
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._unsubscribe()
+        with self._lock:
+            self._file.close()
+
+def to_chrome_trace(events):
+    """Convert events to the Chrome trace format (chrome://tracing, Perfetto)"""
+    trace = []
+    for event in events:
+        base = {"pid": event.get("pid", 0), "tid": event.get("tid", 0)}
+        kind = event["type"]
+        if kind == "span_end":
+            args = {k: v for k, v in event.items() if k not in ("type", "ts", "pid", "tid", "name", "start", "duration")}
+            trace.append(dict(base, name=event["name"], ph="X", ts=event["start"] * 1e6, dur=event["duration"] * 1e6, args=args))
+        elif kind == "memory":
+            trace.append(dict(base, name="rss_mb", ph="C", ts=event["ts"] * 1e6, args={"rss_mb": event["rss"] / 2**20}))
+        elif kind == "chunk_done":
+            trace.append(dict(base, name="chunks_done", ph="C", ts=event["ts"] * 1e6, args={"done": event["done"]}))
+        elif kind != "span_start":
+            args = {k: v for k, v in event.items() if k not in ("type", "ts", "pid", "tid")}
+            trace.append(dict(base, name=kind, ph="i", s="t", ts=event["ts"] * 1e6, args=args))
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+def jsonl_to_chrome_trace(jsonl_path, output_path):
+    with open(jsonl_path, "r") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    with open(output_path, "w") as f:
+        json.dump(to_chrome_trace(events), f, default=str)
+    return output_path
+
+def console_printer(event):
+    """Human-readable progress lines for the GUI console and the CLI"""
+    if event["type"] == "chunk_done" and event.get("eta") is not None:
+        print(f"[time_estimate] {event['done']}/{event['total']} chunks done, average chunk time {format_time(event['average'])}")
+        print(f"[time_estimate] Estimated remaining time: {format_time(event['eta'])}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("usage: python3 events.py TRACE.jsonl OUTPUT.json")
+        sys.exit(2)
+    print(f"[events] Chrome trace written to {jsonl_to_chrome_trace(sys.argv[1], sys.argv[2])}")
@@ -0,0 +1,219 @@
+import abc
+import datetime
+import html
+import itertools
+import json
+import pathlib
+import time
+
+# The GUI's radio buttons and older callers pass formats as numbers.
+FILE_TYPES = {1: "md", 2: "html", 3: "txt", 4: "srt", 5: "vtt", 6: "json"}
+
+def transcriptions_dir(output_dir=None):
+    if output_dir:
+        folder = pathlib.Path(output_dir)
+    else:
+        folder = pathlib.Path.home() / "Documents" / "transcriptions"
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+def resolve_formats(file_type):
+    """Format names from a file type number, a name, a comma-separated string or a list of those"""
+    if isinstance(file_type, (list, tuple)):
+        names = [name for item in file_type for name in resolve_formats(item)]
+    elif isinstance(file_type, int):
+        names = [FILE_TYPES.get(file_type)]
+    else:
+        names = [name.strip().lower() for name in str(file_type).split(",") if name.strip()]
+    unknown = [name for name in names if name not in FORMATS]
+    if unknown or not names:
+        raise ValueError(f"Unknown transcript format {file_type!r}, expected one of {', '.join(FORMATS)}")
+    return list(dict.fromkeys(names))
+
+def _clock(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+def _json_default(value):
+    # NumPy scalars from the aligner.
+    return value.item() if hasattr(value, "item") else str(value)
+
+class Writer(abc.ABC):
+    """One output format; gets every segment once, already unpacked"""
+
+    extension = None
+    label = None
+    # Whether segment() reads words; building word dicts is skipped otherwise.
+    needs_words = False
+
+    def __init__(self, f, title, language):
+        self.f = f
+        self.title = title
+        self.language = language
+
+    def begin(self):
+        pass
+
+    @abc.abstractmethod
+    def segment(self, speaker, start, end, text, words):
+        pass
+
+    def end(self):
+        pass
+
+class MarkdownWriter(Writer):
+    extension = "md"
+    label = "Markdown"
+
+    def segment(self, speaker, start, end, text, words):
+        self.f.write(f"**{speaker}** [{start:.2f}-{end:.2f}]: {text}\n")
+
+class HtmlWriter(Writer):
+    extension = "html"
+    label = "HTML"
+
+    def begin(self):
+        self.f.write(f'<!DOCTYPE html>\n<html lang="{html.escape(self.language or "en")}">\n<head>\n'
+                     f'<meta charset="utf-8">\n<title>{html.escape(self.title)}</title>\n</head>\n<body>\n')
+
+    def segment(self, speaker, start, end, text, words):
+        self.f.write(f"<p><b>{html.escape(speaker)}</b> [{start:.2f}-{end:.2f}]: {html.escape(text)}</p>\n")
+
+    def end(self):
+        self.f.write("</body>\n</html>\n")
+
+class TextWriter(Writer):
+    extension = "txt"
+    label = "Text"
+
+    def segment(self, speaker, start, end, text, words):
+        self.f.write(f"{speaker} [{start:.2f}-{end:.2f}]: {text}\n")
+
+class SrtWriter(Writer):
+    extension = "srt"
+    label = "SubRip"
+
+    def begin(self):
+        self.index = 0
+
+    def segment(self, speaker, start, end, text, words):
+        self.index += 1
+        self.f.write(f"{self.index}\n{_clock(start, ',')} --> {_clock(end, ',')}\n{speaker}: {text.strip()}\n\n")
+
+class VttWriter(Writer):
+    extension = "vtt"
+    label = "WebVTT"
+
+    def begin(self):
+        self.f.write("WEBVTT\n\n")
+
+    def segment(self, speaker, start, end, text, words):
+        # Cue text may not contain a bare "-->", and <, > and & must be escaped.
+        text = html.escape(text.strip(), quote=False).replace("-->", "--&gt;")
+        self.f.write(f"{_clock(start, '.')} --> {_clock(end, '.')}\n<v {html.escape(speaker, quote=False)}>{text}\n\n")
+
+class JsonWriter(Writer):
+    extension = "json"
+    label = "JSON"
+    needs_words = True
+
+    def begin(self):
+        self.first = True
+        header = json.dumps({"title": self.title, "language": self.language})
+        self.f.write(header[:-1] + ', "segments": [')
+
+    def segment(self, speaker, start, end, text, words):
+        entry = {"speaker": speaker, "start": start, "end": end, "text": text, "words": [
+            {key: word[key] for key in ("word", "start", "end", "score", "speaker") if key in word}
+            for word in words
+        ]}
+        self.f.write(("\n" if self.first else ",\n") + json.dumps(entry, ensure_ascii=False, default=_json_default))
+        self.first = False
+
+    def end(self):
+        self.f.write("\n]}\n")
+
+FORMATS = {writer.extension: writer for writer in (MarkdownWriter, HtmlWriter, TextWriter, SrtWriter, VttWriter, JsonWriter)}
+
+def _create(folder, base, extension):
+    # Two jobs with the same name can finish in the same second, e.g. on the server.
+    for attempt in itertools.count(1):
+        path = folder / (f"{base}.{extension}" if attempt == 1 else f"{base}-{attempt}.{extension}")
+        try:
+            return path, open(path, "x", encoding="utf-8")
+        except FileExistsError:
+            continue
+
+class Export:
+    """Writes a transcript to several formats at once, segment by segment
+
+    Segments can be written in batches as they become available; each one is
+    unpacked once and handed to every format's writer.
+    """
+
+    def __init__(self, folder, file_name, formats, language=None):
+        stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.paths = {}
+        self.writers = []
+        self.segments = 0
+        self.start_time = time.time()
+        for name in resolve_formats(formats):
+            path, f = _create(pathlib.Path(folder), f"{file_name}_{stamp}", name)
+            print(f"[export] Writing results to {path} ({FORMATS[name].label} format)")
+            writer = FORMATS[name](f, file_name, language)
+            writer.begin()
+            self.paths[name] = path
+            self.writers.append(writer)
+
+    def write(self, segments):
+        for segment in segments:
+            speaker = segment.get("speaker", "Unknown")
+            start = segment["start"]
+            end = segment["end"]
+            text = segment.get("text", "")
+            words = segment.get("words", [])
+            for writer in self.writers:
+                writer.segment(speaker, start, end, text, words)
+        self.segments += len(segments)
+        for writer in self.writers:
+            writer.f.flush()
+
+    def write_transcript(self, transcript):
+        """Write every segment of a Transcript straight from its columns"""
+        with_words = any(writer.needs_words for writer in self.writers)
+        for i, (speaker, start, end, text) in enumerate(transcript.rows()):
+            words = transcript.words(i) if with_words else ()
+            for writer in self.writers:
+                writer.segment(speaker, start, end, text, words)
+        self.segments += len(transcript)
+        for writer in self.writers:
+            writer.f.flush()
+
+    def close(self):
+        for writer in self.writers:
+            if not writer.f.closed:
+                writer.end()
+                writer.f.close()
+        print(f"[export] Wrote {self.segments} segments in {time.time() - self.start_time:.2f} seconds.")
+        return self.paths
+
+    def discard(self):
+        for writer in self.writers:
+            writer.f.close()
+        for path in self.paths.values():
+            path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def export(transcript, folder, file_name, formats):
+    """Write a Transcript to every format in one pass; returns {format: path}"""
+    with Export(folder, file_name, formats, transcript.language) as writer:
+        writer.write_transcript(transcript)
+    return writer.paths
@@ -0,0 +1,177 @@
+import itertools
+import threading
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_ids = itertools.count(1)
+
+class Job:
+    def __init__(self, audio_path, file_name, file_type, **options):
+        self.id = next(_ids)
+        self.audio_path = audio_path
+        self.file_name = file_name
+        self.file_type = file_type
+        self.options = options
+        self.status = QUEUED
+        self.done_chunks = 0
+        self.total_chunks = 0
+        self.output_paths = {}
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._eta = None
+
+    def update_progress(self, done_chunks, total_chunks, eta=None):
+        """Progress from a chunk_done event; eta is the run's own EtaEstimator estimate"""
+        self.done_chunks = done_chunks
+        self.total_chunks = total_chunks
+        self._eta = None if eta is None else (eta, time.time())
+
+    @property
+    def progress(self):
+        if self.status == DONE:
+            return 1.0
+        return self.done_chunks / self.total_chunks if self.total_chunks else 0.0
+
+    @property
+    def eta(self):
+        if self.status != RUNNING or self._eta is None:
+            return None
+        # Counts down between chunks instead of standing still.
+        eta, at = self._eta
+        return max(0.0, eta - (time.time() - at))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "audio_path": self.audio_path,
+            "file_name": self.file_name,
+            "status": self.status,
+            "progress": self.progress,
+            "eta": self.eta,
+            "output_paths": {name: str(path) for name, path in self.output_paths.items()},
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobQueue:
+    """Ordered jobs run by long-lived worker threads, so models stay loaded between jobs
+
+    keep_finished caps how many finished, failed or cancelled jobs are kept;
+    the oldest are forgotten first. None keeps them all.
+    """
+
+    def __init__(self, runner, workers=1, on_change=None, keep_finished=None):
+        self.runner = runner
+        self.on_change = on_change
+        self.keep_finished = keep_finished
+        self._jobs = []
+        self._condition = threading.Condition()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _changed(self, job):
+        if job.status not in (QUEUED, RUNNING):
+            self._forget_old()
+        if self.on_change:
+            self.on_change(job)
+
+    def _forget_old(self):
+        if self.keep_finished is None:
+            return
+        with self._condition:
+            finished = sorted((job for job in self._jobs if job.status not in (QUEUED, RUNNING)),
+                              key=lambda job: job.finished_at or 0)
+            expired = {job.id for job in finished[:max(0, len(finished) - self.keep_finished)]}
+            if expired:
+                self._jobs = [job for job in self._jobs if job.id not in expired]
+
+    def submit(self, job):
+        with self._condition:
+            self._jobs.append(job)
+            self._condition.notify()
+        self._changed(job)
+        return job
+
+    def jobs(self):
+        with self._condition:
+            return list(self._jobs)
+
+    def get(self, job_id):
+        with self._condition:
+            for job in self._jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def pending_count(self):
+        with self._condition:
+            return sum(1 for job in self._jobs if job.status in (QUEUED, RUNNING))
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status not in (QUEUED, RUNNING):
+            return False
+        job.cancel_event.set()
+        with self._condition:
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+        self._changed(job)
+        return True
+
+    def move(self, job_id, offset):
+        """Move a queued job up (negative offset) or down among the queued jobs"""
+        with self._condition:
+            queued = [job for job in self._jobs if job.status == QUEUED]
+            job = next((job for job in queued if job.id == job_id), None)
+            if job is None:
+                return False
+            position = max(0, min(len(queued) - 1, queued.index(job) + offset))
+            queued.remove(job)
+            queued.insert(position, job)
+            others = [job for job in self._jobs if job.status != QUEUED]
+            self._jobs = others + queued
+        self._changed(job)
+        return True
+
+    def clear_finished(self):
+        with self._condition:
+            self._jobs = [job for job in self._jobs if job.status in (QUEUED, RUNNING)]
+
+    def _next_job(self):
+        with self._condition:
+            while True:
+                for job in self._jobs:
+                    if job.status == QUEUED:
+                        job.status = RUNNING
+                        job.started_at = time.time()
+                        return job
+                self._condition.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            self._changed(job)
+            try:
+                job.output_paths = self.runner(job) or {}
+                job.status = DONE
+            except Exception as e:
+                if job.cancel_event.is_set():
+                    job.status = CANCELLED
+                else:
+                    job.error = f"{type(e).__name__}: {e}"
+                    job.status = FAILED
+                    print(f"[jobs] Job {job.id} failed: {job.error}")
+            job.finished_at = time.time()
+            self._changed(job)
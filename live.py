@@ -0,0 +1,153 @@
+import datetime
+import pathlib
+import queue
+import threading
+import time
+import wave
+
+import numpy as np
+
+import models
+import transcription
+from audio import SAMPLE_RATE
+
+step_s = 2.0
+max_buffer_s = 30.0
+settle_s = 1.5
+frames_per_buffer = 1024
+
+def default_recording_path(file_name="Session"):
+    recordings_folder = pathlib.Path.home() / "Documents" / "recordings"
+    recordings_folder.mkdir(parents=True, exist_ok=True)
+    dt = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    return recordings_folder / f"{file_name}_{dt}.wav"
+
+def _clock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def list_input_devices():
+    import pyaudio
+    pa = pyaudio.PyAudio()
+    try:
+        devices = []
+        for index in range(pa.get_device_count()):
+            info = pa.get_device_info_by_index(index)
+            if info.get("maxInputChannels", 0) > 0:
+                devices.append((index, info["name"]))
+        return devices
+    finally:
+        pa.terminate()
+
+class LiveSession:
+    """Capture from an input device, write it to disk and transcribe it incrementally"""
+
+    def __init__(self, output_path=None, device_index=None, language="en", on_text=None, inference=None):
+        self.output_path = pathlib.Path(output_path or default_recording_path())
+        self.inference = inference or transcription.current_config()
+        self.device_index = device_index
+        self.language = language
+        self.on_text = on_text or (lambda text, final: print(f"[live]{'' if final else ' ...'} {text}"))
+        self._frames = queue.Queue()
+        self._pcm = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pa = None
+        self._stream = None
+
+    def start(self):
+        import pyaudio
+        # Load the model before opening the stream so the first seconds aren't
+        # spent waiting on it while audio piles up.
+        self.model = models.get_whisper_model(self.inference.model, self.language, self.inference.device,
+                                              self.inference.compute_type, transcription.threads_per_worker)
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(format=pyaudio.paInt16, channels=1, rate=SAMPLE_RATE, input=True,
+                                     input_device_index=self.device_index, frames_per_buffer=frames_per_buffer,
+                                     stream_callback=self._callback)
+        self._threads = [
+            threading.Thread(target=self._write, daemon=True),
+            threading.Thread(target=self._transcribe, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"[live] Recording to {self.output_path}")
+
+    def _callback(self, data, frame_count, time_info, status):
+        import pyaudio
+        self._pcm.put(data)
+        self._frames.put(data)
+        return (None, pyaudio.paContinue)
+
+    def _write(self):
+        with wave.open(str(self.output_path), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            while not (self._stop.is_set() and self._pcm.empty()):
+                try:
+                    f.writeframes(self._pcm.get(timeout=0.2))
+                except queue.Empty:
+                    continue
+
+    def _drain(self):
+        blocks = []
+        while True:
+            try:
+                blocks.append(self._frames.get_nowait())
+            except queue.Empty:
+                break
+        if not blocks:
+            return np.zeros(0, dtype=np.float32)
+        return np.frombuffer(b"".join(blocks), np.int16).astype(np.float32) / 32768.0
+
+    def _emit(self, buffer, buffer_start, final_all):
+        if len(buffer) < SAMPLE_RATE // 2:
+            return buffer, buffer_start
+        result = models.transcribe(self.model, buffer, self.inference.batch_size, self.language)
+        segments = result.get("segments", [])
+        buffer_len = len(buffer) / SAMPLE_RATE
+        # Segments ending well before the buffer's tail won't change with more
+        # audio, so they are committed and dropped from the buffer.
+        settled = buffer_len if final_all or buffer_len >= max_buffer_s else buffer_len - settle_s
+        committed_end = 0.0
+        pending = []
+        for segment in segments:
+            text = segment.get("text", "").strip()
+            if segment["end"] <= settled:
+                self.on_text(f"[{_clock(buffer_start + segment['start'])}] {text}", True)
+                committed_end = segment["end"]
+            elif text:
+                pending.append(text)
+        if pending:
+            self.on_text(" ".join(pending), False)
+        if not segments and buffer_len >= max_buffer_s:
+            committed_end = buffer_len
+        cut = int(committed_end * SAMPLE_RATE)
+        return buffer[cut:], buffer_start + committed_end
+
+    def _transcribe(self):
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_start = 0.0
+        last_step = time.time()
+        while not self._stop.is_set():
+            time.sleep(0.1)
+            if time.time() - last_step < step_s:
+                continue
+            last_step = time.time()
+            buffer = np.concatenate((buffer, self._drain()))
+            buffer, buffer_start = self._emit(buffer, buffer_start, False)
+        buffer = np.concatenate((buffer, self._drain()))
+        self._emit(buffer, buffer_start, True)
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._pa.terminate()
+            self._stream = None
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        print(f"[live] Recording saved to {self.output_path}")
+        return self.output_path
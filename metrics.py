@@ -0,0 +1,63 @@
+import resource
+import sys
+import threading
+
+import events
+
+_lock = threading.Lock()
+_stages = {}
+
+def _on_event(event):
+    if event["type"] != "span_end":
+        return
+    with _lock:
+        total, count = _stages.get(event["name"], (0.0, 0))
+        _stages[event["name"]] = (total + event["duration"], count + 1)
+
+events.subscribe(_on_event)
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return peak_rss_bytes()
+
+def sample_memory(**fields):
+    return events.emit("memory", rss=current_rss_bytes(), **fields)
+
+class MemorySampler:
+    """Emit a memory event every interval seconds until stopped"""
+
+    def __init__(self, interval=5.0, **fields):
+        self.interval = interval
+        self.fields = fields
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            sample_memory(**self.fields)
+
+    def __enter__(self):
+        sample_memory(**self.fields)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        sample_memory(**self.fields)
+
+def snapshot():
+    with _lock:
+        return {stage: {"seconds": round(total, 4), "count": count} for stage, (total, count) in _stages.items()}
+
+def reset():
+    with _lock:
+        _stages.clear()
@@ -0,0 +1,92 @@
+import gc
+import hashlib
+import threading
+import time
+
+import torch
+import whisperx
+
+import events
+
+_models = {}
+_lock = threading.Lock()
+_key_locks = {}
+# Loaded models are shared by every job in the process, and neither the
+# Whisper pipeline nor wav2vec2 is known to be safe to call from several
+# threads, so calls into one model are serialized by a lock per key.
+_model_keys = {}
+_inference_locks = {}
+
+def _get_or_load(key, loader):
+    # _lock only guards the dicts; the load itself holds a lock per key, so
+    # e.g. Whisper and pyannote can load side by side while a second request
+    # for the same model waits for the first instead of loading it twice.
+    with _lock:
+        if key in _models:
+            return _models[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        with _lock:
+            if key in _models:
+                return _models[key]
+        print(f"[models] Loading {key[0]} model: {key[1:]}")
+        start_time = time.time()
+        with events.span("model_load", kind=key[0]):
+            model = loader()
+        with _lock:
+            _models[key] = model
+            _model_keys[id(model)] = key
+        duration = time.time() - start_time
+        events.emit("model_loaded", kind=key[0], key=[str(part) for part in key[1:]], duration=duration)
+        print(f"[models] Loaded {key[0]} model in {duration:.2f} seconds.")
+        return model
+
+def get_whisper_model(name, language, device, compute_type, threads=0):
+    # Whisper runs in CTranslate2, which takes its CPU thread count at load
+    # time; torch.set_num_threads doesn't reach it. 0 keeps whisperx's default.
+    key = ("whisper", name, language, device, compute_type, threads)
+    options = {"threads": threads} if threads else {}
+    return _get_or_load(key, lambda: whisperx.load_model(name, device, compute_type=compute_type, language=language, **options))
+
+def get_align_model(language, device):
+    # No compute_type: wav2vec2 always runs in float32, so runs at different
+    # precisions share one alignment model.
+    key = ("align", None, language, device, None)
+    return _get_or_load(key, lambda: whisperx.load_align_model(language_code=language, device=device))
+
+def get_diarize_pipeline(token, device):
+    # Key on a digest of the token so it never ends up in logs.
+    token_id = hashlib.sha1(token.encode("utf-8")).hexdigest()[:8]
+    key = ("diarize", None, token_id, device, None)
+    return _get_or_load(key, lambda: whisperx.diarize.DiarizationPipeline(use_auth_token=token, device=device))
+
+def inference_lock(model):
+    """The lock every call into a loaded model holds; models from outside the registry share one"""
+    with _lock:
+        return _inference_locks.setdefault(_model_keys.get(id(model)), threading.Lock())
+
+def transcribe(model, audio, batch_size, language):
+    with inference_lock(model):
+        return model.transcribe(audio, batch_size=batch_size, language=language)
+
+def align(segments, align_model, audio, device):
+    model_a, metadata = align_model
+    with inference_lock(align_model):
+        return whisperx.align(segments, model_a, metadata, audio, device, return_char_alignments=False)
+
+def loaded_models():
+    with _lock:
+        return list(_models.keys())
+
+def unload_models(kind=None):
+    with _lock:
+        keys = [key for key in _models if kind is None or key[0] == kind]
+        for key in keys:
+            print(f"[models] Unloading {key[0]} model: {key[1:]}")
+            # _model_keys keeps the entry: a job still holding the model must
+            # keep sharing its lock.
+            del _models[key]
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    return len(keys)
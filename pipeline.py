@@ -0,0 +1,134 @@
+import time
+
+import audio as audio_io
+import budget as memory_budget
+import cache
+import diarization
+import diarize
+import events
+import exporters
+import metrics
+import transcription
+import unknown_handler
+from transcript import Transcript
+
+def run_pipeline(audio_path, token, file_name, file_type, open_file=True, output_dir=None,
+                 language="en", min_speakers=None, max_speakers=None, cancel_event=None, on_progress=None, inference=None,
+                 unknown_options=None):
+    """Transcribe, diarize, fix unknown speakers and export one recording; returns {format: path}
+
+    unknown_options are keyword arguments for unknown_handler.handle_unknown_speakers.
+    """
+    with events.span("pipeline", file=audio_path), metrics.MemorySampler(file=audio_path):
+        try:
+            return _run_pipeline(audio_path, token, file_name, file_type, open_file, output_dir, language,
+                                 min_speakers, max_speakers, cancel_event, on_progress, inference, unknown_options or {})
+        finally:
+            # Later runs reuse the stage artifacts, not the decoded samples, so
+            # the float32 copy of the recording goes as soon as the run is over.
+            audio_io.discard(audio_path)
+
+# Bump a stage's version whenever its algorithm or artifact layout changes, so
+# artifacts written by older code are never reused.
+STAGE_VERSIONS = {"transcript": 1, "turns": 1, "assigned": 2, "speaker_fix": 2, "names": 1}
+
+def _key(stage, *parts):
+    return cache.artifact_key(stage, STAGE_VERSIONS[stage], *parts)
+
+def _stage(audio_hash, name, key, compute, encode=None, decode=None):
+    """The stage's artifact for key from the cache, or compute() it and store it
+
+    encode and decode convert an artifact that is not plain JSON to and from its stored form.
+    """
+    if audio_hash:
+        artifact = cache.load_artifact(audio_hash, name, key)
+        if artifact is not None:
+            print(f"[pipeline] Reusing {name} from an earlier run.")
+            events.emit("stage_reused", stage=name, key=key)
+            return decode(artifact) if decode else artifact
+    artifact = compute()
+    if audio_hash:
+        cache.save_artifact(audio_hash, name, key, encode(artifact) if encode else artifact)
+    return artifact
+
+def _measure(budget, stage):
+    if budget:
+        budget.measure(stage)
+
+def _run_pipeline(audio_path, token, file_name, file_type, open_file, output_dir, language,
+                  min_speakers, max_speakers, cancel_event, on_progress, inference, unknown_options):
+    start_time = time.time()
+    inference = inference or transcription.current_config()
+    audio_hash = cache.file_hash(audio_path) if transcription.use_cache else None
+
+    # Each stage's key covers its version, its upstream keys and its own settings,
+    # so changing e.g. the unknown-speaker settings only re-runs that stage and
+    # the ones after it.
+    transcript_key = _key("transcript", audio_hash, inference.cache_name, language)
+    turns_key = _key("turns", audio_hash, diarization.window_s, diarization.link_threshold, min_speakers, max_speakers)
+    assigned_key = _key("assigned", transcript_key, turns_key)
+    fixed_key = _key("speaker_fix", assigned_key, unknown_options)
+    names_key = _key("names", fixed_key, diarize.roster)
+
+    budget = memory_budget.MemoryBudget(transcription.memory_budget_bytes, audio_path) if transcription.memory_budget_bytes else None
+
+    def transcribe():
+        # A speaker-less plain-text preview that grows as chunks finish, removed
+        # once transcription is over. One format is enough to follow along, and
+        # it lives in the cache so a crash never leaves it among the transcripts.
+        partial = exporters.Export(cache.preview_dir(), file_name, "txt", language)
+        try:
+            print(f"[pipeline] Starting transcription of {audio_path}")
+            _, result = transcription.process_audio(audio_path, language=language, cancel_event=cancel_event,
+                                                    on_progress=on_progress, inference=inference, on_segments=partial.write,
+                                                    budget=budget)
+        finally:
+            partial.discard()
+        _measure(budget, "transcribe")
+        if cancel_event is not None and cancel_event.is_set():
+            raise transcription.ProcessingCancelled()
+        return result
+
+    def find_turns():
+        if budget:
+            budget.make_room_for_diarization()
+        print("[pipeline] Starting diarization...")
+        # Decoded only now, so a run that reuses both the transcript and the
+        # turns never touches the audio.
+        samples = audio_io.AudioSource(audio_path).samples
+        turns = transcription.diarize_turns(token, samples, audio_hash, min_speakers, max_speakers, inference)
+        _measure(budget, "diarize")
+        return turns
+
+    def assign():
+        result = _stage(audio_hash, "transcript", transcript_key, transcribe)
+        turns = _stage(audio_hash, "turns", turns_key, find_turns)
+        assigned = transcription.assign_speakers(turns, result)
+        _measure(budget, "assign_speakers")
+        return assigned
+
+    def fix_unknown():
+        # From here on the transcript stays columnar: unknown speakers, names
+        # and export all work on the Transcript instead of per-segment dicts.
+        transcript = Transcript.from_result(_stage(audio_hash, "assigned", assigned_key, assign))
+        print("[pipeline] Handling unknown speakers...")
+        with events.span("speaker_fix"):
+            transcript = unknown_handler.handle_unknown_speakers(transcript, **unknown_options)
+        _measure(budget, "speaker_fix")
+        return transcript
+
+    try:
+        finalized = _stage(audio_hash, "speaker_fix", fixed_key, fix_unknown, Transcript.to_columns, Transcript.from_columns)
+        speaker_map = _stage(audio_hash, "names", names_key, lambda: diarize.find_speaker_names(finalized))
+        print("[pipeline] Saving results to file...")
+        with events.span("export"):
+            output_paths = transcription.output_results_to_file(finalized, file_name, file_type, open_file=open_file,
+                                                                output_dir=output_dir, speaker_map=speaker_map)
+        _measure(budget, "export")
+    finally:
+        if budget:
+            report = budget.report()
+            events.emit("budget", file=audio_path, **report)
+            print(f"[pipeline] Memory: {memory_budget.describe(report)}")
+    print(f"[pipeline] Finished {audio_path} in {time.time() - start_time:.2f} seconds.")
+    return output_paths
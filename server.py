@@ -0,0 +1,315 @@
+import argparse
+import http.server
+import itertools
+import json
+import os
+import pathlib
+import re
+import shutil
+import sys
+import time
+import urllib.parse
+
+import config
+import events
+import exporters
+import jobs
+import metrics
+
+upload_dir = config.config_dir / "uploads"
+upload_block = 1 << 20
+memory_poll_s = 2.0
+
+CONTENT_TYPES = {
+    ".md": "text/markdown; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+    ".txt": "text/plain; charset=utf-8",
+    ".srt": "application/x-subrip; charset=utf-8",
+    ".vtt": "text/vtt; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+}
+
+class JobService:
+    """Runs submitted recordings on a pool of pipeline workers that share one model cache"""
+
+    def __init__(self, token, inference, workers=1, max_pending=8, max_rss_bytes=None, output_dir=None, keep_jobs=100):
+        self.token = token
+        self.inference = inference
+        self.max_pending = max_pending
+        self.max_rss_bytes = max_rss_bytes
+        self.output_dir = output_dir
+        # Uploaded recordings that belong to this service and go once their job is over.
+        self.uploads = set()
+        # Finished jobs are only kept for GET /jobs, so a long-running server forgets the oldest.
+        self.queue = jobs.JobQueue(self.run_job, workers=workers, on_change=self.on_job_change, keep_finished=keep_jobs)
+
+    def over_memory(self):
+        return bool(self.max_rss_bytes) and metrics.current_rss_bytes() > self.max_rss_bytes
+
+    def busy_reason(self):
+        """Why a new submission would be turned away right now, or None"""
+        if self.queue.pending_count() >= self.max_pending:
+            return f"{self.max_pending} jobs are already queued or running"
+        if self.over_memory():
+            return "memory limit reached"
+        return None
+
+    def submit(self, audio_path, file_name=None, file_type="md", language="en", min_speakers=None, max_speakers=None,
+               uploaded=False):
+        """Queue a recording; uploaded ones are deleted when their job finishes, fails or is cancelled"""
+        file_type = exporters.resolve_formats(file_type)
+        file_name = file_name or pathlib.Path(audio_path).stem
+        job = jobs.Job(str(audio_path), file_name, file_type, language=language,
+                       min_speakers=min_speakers, max_speakers=max_speakers)
+        if uploaded:
+            self.uploads.add(job.audio_path)
+        return self.queue.submit(job)
+
+    def on_job_change(self, job):
+        if job.status not in (jobs.DONE, jobs.FAILED, jobs.CANCELLED):
+            return
+        try:
+            self.uploads.remove(job.audio_path)
+        except KeyError:
+            return
+        pathlib.Path(job.audio_path).unlink(missing_ok=True)
+
+    def run_job(self, job):
+        import pipeline
+        # Resident models dominate memory, so one job always runs; more only
+        # start while there is headroom.
+        while self.over_memory() and self.running_count() > 1 and not job.cancel_event.is_set():
+            time.sleep(memory_poll_s)
+        return pipeline.run_pipeline(job.audio_path, self.token, job.file_name, job.file_type, open_file=False,
+                                     output_dir=self.output_dir, cancel_event=job.cancel_event,
+                                     on_progress=job.update_progress, inference=self.inference, **job.options)
+
+    def running_count(self):
+        return sum(1 for job in self.queue.jobs() if job.status == jobs.RUNNING)
+
+    def transcript_path(self, job, file_format=None):
+        """The job's transcript in file_format, or its first format; None if there is no such file"""
+        if job.status != jobs.DONE or not job.output_paths:
+            return None
+        path = job.output_paths.get(file_format) if file_format else next(iter(job.output_paths.values()))
+        return path if path is not None and path.exists() else None
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    service = None
+
+    def log_message(self, format, *args):
+        print(f"[server] {self.address_string()} {format % args}")
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {"error": message}, headers)
+
+    def route(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        return parts, query
+
+    def find_job(self, job_id):
+        job = self.service.queue.get(int(job_id)) if job_id.isdigit() else None
+        if job is None:
+            self.send_error_json(404, f"no job {job_id}")
+        return job
+
+    def do_GET(self):
+        parts, query = self.route()
+        if parts == ["health"]:
+            self.send_json(200, {
+                "status": "busy" if self.service.busy_reason() else "ok",
+                "pending": self.service.queue.pending_count(),
+                "rss_bytes": metrics.current_rss_bytes(),
+                "inference": repr(self.service.inference),
+            })
+        elif parts == ["jobs"]:
+            self.send_json(200, [job.to_dict() for job in self.service.queue.jobs()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.find_job(parts[1])
+            if job:
+                self.send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "transcript":
+            job = self.find_job(parts[1])
+            if job:
+                self.send_transcript(job, query.get("format"))
+        else:
+            self.send_error_json(404, "not found")
+
+    def send_transcript(self, job, file_format):
+        if job.status != jobs.DONE:
+            self.send_error_json(409, f"job {job.id} is {job.status}, no transcript available")
+            return
+        if file_format and file_format not in job.output_paths:
+            # Only the formats the job was exported to exist; anything else is not a format at all.
+            self.send_error_json(404 if file_format in exporters.FORMATS else 400,
+                                 f"job {job.id} has no {file_format!r} transcript, "
+                                 f"it was exported as {', '.join(job.output_paths) or 'nothing'}")
+            return
+        path = self.service.transcript_path(job, file_format)
+        if path is None:
+            self.send_error_json(404, f"the transcript of job {job.id} is gone")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(path.suffix, "application/octet-stream"))
+        self.send_header("Content-Length", str(path.stat().st_size))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_POST(self):
+        parts, query = self.route()
+        if parts != ["jobs"]:
+            self.send_error_json(404, "not found")
+            return
+        reason = self.service.busy_reason()
+        if reason:
+            # Drain the body so the client sees the response instead of a reset connection.
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining > 0:
+                block = self.rfile.read(min(upload_block, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+            self.send_error_json(503, f"server busy: {reason}", {"Retry-After": "30"})
+            return
+        uploaded = None
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                options = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not isinstance(options, dict):
+                    self.send_error_json(400, "the JSON body must be an object")
+                    return
+                audio_path = options.pop("path", None)
+                if not audio_path or not os.path.isfile(audio_path):
+                    self.send_error_json(400, f"no such file: {audio_path}")
+                    return
+            else:
+                options = dict(query)
+                filename = options.pop("filename", "upload.wav")
+                options.setdefault("name", pathlib.Path(filename).stem)
+                audio_path = uploaded = self.receive_upload(filename)
+            job = self.service.submit(audio_path, options.get("name"), options.get("format", "md"),
+                                      options.get("language", "en"), _int(options.get("min_speakers")),
+                                      _int(options.get("max_speakers")), uploaded=bool(uploaded))
+        except ValueError as e:
+            if uploaded:
+                uploaded.unlink(missing_ok=True)
+            self.send_error_json(400, str(e))
+            return
+        self.send_json(202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+
+    def receive_upload(self, filename):
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise ValueError("uploads need a Content-Length header")
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        remaining = int(length)
+        path, f = _create_upload(re.sub(r"[^\w.-]", "_", pathlib.Path(filename).name))
+        # Streamed to disk in blocks, so a multi-hour recording never sits in memory.
+        with f:
+            while remaining > 0:
+                block = self.rfile.read(min(upload_block, remaining))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        if remaining:
+            path.unlink()
+            raise ValueError("upload ended early")
+        return path
+
+    def do_DELETE(self):
+        parts, _ = self.route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.find_job(parts[1])
+            if job:
+                cancelled = self.service.queue.cancel(job.id)
+                self.send_json(200 if cancelled else 409, job.to_dict())
+        else:
+            self.send_error_json(404, "not found")
+
+def _create_upload(safe_name):
+    stamp = int(time.time() * 1000)
+    # Two uploads with the same name can arrive in the same millisecond.
+    for attempt in itertools.count(1):
+        path = upload_dir / (f"{stamp}_{safe_name}" if attempt == 1 else f"{stamp}-{attempt}_{safe_name}")
+        try:
+            return path, open(path, "xb")
+        except FileExistsError:
+            continue
+
+def _int(value):
+    return None if value in (None, "") else int(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve transcription jobs over HTTP on this machine.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("--workers", type=int, default=1, help="jobs processed at the same time; they share the models, which run one call at a time, so only different stages overlap (default: 1)")
+    parser.add_argument("--max-pending", type=int, default=8, help="queued and running jobs before new ones are refused (default: 8)")
+    parser.add_argument("--max-rss-mb", type=int, help="refuse new jobs and hold back extra workers above this resident memory")
+    parser.add_argument("--memory-budget", type=float, help="resident memory limit in GB for the whole server, shared by running jobs; chunk length and batch size adapt to stay under it")
+    parser.add_argument("--keep-jobs", type=int, default=100, help="finished jobs listed by GET /jobs before the oldest are forgotten (default: 100)")
+    parser.add_argument("--output-dir", help="where transcripts are written (default: ~/Documents/transcriptions)")
+    parser.add_argument("--token", help="HuggingFace token (default: HF_TOKEN or the one saved by the GUI)")
+    parser.add_argument("--model", default="large-v2", help="Whisper model (default: large-v2)")
+    parser.add_argument("--device", default="auto", help="cpu, cuda or auto (default: auto)")
+    parser.add_argument("--compute-type", default="auto", help="float32, float16, int8, int8_float16 or auto (default: auto)")
+    parser.add_argument("--batch-size", type=int, help="transcription batch size (default: chosen for the device)")
+    parser.add_argument("--processes", type=int, default=1, help="on CPU, transcribe chunks in this many worker processes, each with its own models (default: 1)")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="CPU threads for each worker's models; keep processes x threads near the core count (default: library defaults)")
+    parser.add_argument("--diarize-window", type=float, help="diarize long recordings in windows of this many seconds and link the speakers across them, bounding diarization memory (default: whole recording at once)")
+    parser.add_argument("--warm-up", action="store_true", help="load the models before accepting jobs")
+    args = parser.parse_args(argv)
+
+    token = args.token or os.environ.get("HF_TOKEN") or config.load_token()
+    if not token:
+        print("[server] Error: HuggingFace token not set. Pass --token, set HF_TOKEN or save one from the GUI.", file=sys.stderr)
+        return 2
+
+    import backend
+    try:
+        inference = backend.InferenceConfig(args.model, args.device, args.compute_type, args.batch_size)
+    except ValueError as e:
+        print(f"[server] Error: {e}", file=sys.stderr)
+        return 2
+    events.subscribe(events.console_printer)
+    import transcription
+    transcription.process_workers = max(1, args.processes)
+    transcription.threads_per_worker = max(0, args.threads_per_worker)
+    if args.diarize_window:
+        import diarization
+        diarization.window_s = args.diarize_window
+    if args.memory_budget:
+        import budget
+        transcription.memory_budget_bytes = int(args.memory_budget * budget.GB)
+    if args.warm_up:
+        transcription.warm_up(token=token, inference=inference)
+
+    max_rss_bytes = args.max_rss_mb * 2**20 if args.max_rss_mb else None
+    Handler.service = JobService(token, inference, args.workers, args.max_pending, max_rss_bytes, args.output_dir,
+                                 max(0, args.keep_jobs))
+    httpd = http.server.ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"[server] Listening on http://{args.host}:{httpd.server_address[1]} with {args.workers} worker(s), {inference}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
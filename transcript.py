@@ -0,0 +1,216 @@
+import sys
+
+import numpy as np
+
+UNKNOWN = "Unknown"
+NO_SPEAKER = -1
+
+def _pack(strings):
+    """One string buffer plus offsets, so n texts cost two objects instead of n"""
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    if strings:
+        np.cumsum([len(s) for s in strings], out=offsets[1:])
+    return "".join(strings), offsets
+
+def _float(value):
+    return np.nan if value is None else value
+
+class Transcript:
+    """Columnar transcript: NumPy arrays for timings and speaker ids, interned speaker names, packed text
+
+    Segment i spans start[i]..end[i], is spoken by speakers[speaker[i]] (NO_SPEAKER
+    when diarization left it unassigned) and its words are word_* rows
+    word_offsets[i]..word_offsets[i + 1]. Missing word timings, scores and
+    speaker confidences are NaN.
+    """
+
+    def __init__(self, start, end, speaker, speakers, text, text_offsets,
+                 word_offsets=None, word_start=None, word_end=None, word_score=None,
+                 word_speaker=None, word_text="", word_text_offsets=None, language=None, extra=None,
+                 confidence=None, word_confidence=None):
+        self.start = start
+        self.end = end
+        self.speaker = speaker
+        self.confidence = confidence if confidence is not None else np.full(len(start), np.nan)
+        self.speakers = speakers
+        self._speaker_ids = {name: i for i, name in enumerate(speakers)}
+        self._text = text
+        self._text_offsets = text_offsets
+        empty = np.zeros(0)
+        self.word_offsets = word_offsets if word_offsets is not None else np.zeros(len(start) + 1, dtype=np.int64)
+        self.word_start = word_start if word_start is not None else empty
+        self.word_end = word_end if word_end is not None else empty
+        self.word_score = word_score if word_score is not None else empty
+        self.word_speaker = word_speaker if word_speaker is not None else empty.astype(np.int32)
+        self.word_confidence = word_confidence if word_confidence is not None else np.full(len(self.word_start), np.nan)
+        self._word_text = word_text
+        self._word_text_offsets = word_text_offsets if word_text_offsets is not None else np.zeros(1, dtype=np.int64)
+        self.language = language
+        # Top-level result keys other than segments (audio_hash and the like) ride along untouched.
+        self.extra = extra or {}
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from the whisperx {"segments": [...]} format"""
+        segments = result.get("segments", [])
+        speakers = []
+        speaker_ids = {}
+
+        def intern(name):
+            if name is None:
+                return NO_SPEAKER
+            if name not in speaker_ids:
+                speaker_ids[name] = len(speakers)
+                speakers.append(name)
+            return speaker_ids[name]
+
+        start = np.fromiter((segment["start"] for segment in segments), dtype=np.float64, count=len(segments))
+        end = np.fromiter((segment["end"] for segment in segments), dtype=np.float64, count=len(segments))
+        speaker = np.fromiter((intern(segment.get("speaker")) for segment in segments), dtype=np.int32, count=len(segments))
+        confidence = np.fromiter((_float(segment.get("speaker_confidence")) for segment in segments), dtype=np.float64, count=len(segments))
+        text, text_offsets = _pack([segment.get("text", "") for segment in segments])
+
+        words = [word for segment in segments for word in segment.get("words", [])]
+        word_offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        if segments:
+            np.cumsum([len(segment.get("words", [])) for segment in segments], out=word_offsets[1:])
+        word_start = np.fromiter((_float(word.get("start")) for word in words), dtype=np.float64, count=len(words))
+        word_end = np.fromiter((_float(word.get("end")) for word in words), dtype=np.float64, count=len(words))
+        word_score = np.fromiter((_float(word.get("score")) for word in words), dtype=np.float64, count=len(words))
+        word_speaker = np.fromiter((intern(word.get("speaker")) for word in words), dtype=np.int32, count=len(words))
+        word_confidence = np.fromiter((_float(word.get("speaker_confidence")) for word in words), dtype=np.float64, count=len(words))
+        word_text, word_text_offsets = _pack([word.get("word", "") for word in words])
+
+        extra = {key: value for key, value in result.items() if key not in ("segments", "language")}
+        return cls(start, end, speaker, speakers, text, text_offsets, word_offsets, word_start, word_end,
+                   word_score, word_speaker, word_text, word_text_offsets, result.get("language"), extra,
+                   confidence, word_confidence)
+
+    def to_result(self):
+        """Back to the whisperx dict format
+
+        Only start, end, text, speaker, speaker_confidence and words are kept per segment.
+        """
+        words = self._words(0, len(self.word_start))
+        segments = []
+        names = self.speakers + [None]
+        word_offsets = self.word_offsets.tolist()
+        confidences = self.confidence.tolist()
+        for i, (speaker, start, end, text) in enumerate(self._rows(names)):
+            segment = {"start": start, "end": end, "text": text}
+            if speaker is not None:
+                segment["speaker"] = speaker
+            # NaN is the only value that is not equal to itself.
+            if confidences[i] == confidences[i]:
+                segment["speaker_confidence"] = confidences[i]
+            segment["words"] = words[word_offsets[i]:word_offsets[i + 1]]
+            segments.append(segment)
+        return dict(self.extra, segments=segments, language=self.language)
+
+    def _words(self, first, last):
+        """Word dicts for word rows first..last"""
+        names = self.speakers + [None]
+        words = []
+        offsets = self._word_text_offsets[first:last + 1].tolist()
+        columns = zip(self.word_start[first:last].tolist(), self.word_end[first:last].tolist(), self.word_score[first:last].tolist(),
+                      self.word_speaker[first:last].tolist(), self.word_confidence[first:last].tolist())
+        for j, (start, end, score, speaker_id, confidence) in enumerate(columns):
+            word = {"word": self._word_text[offsets[j]:offsets[j + 1]]}
+            if start == start:
+                word["start"] = start
+            if end == end:
+                word["end"] = end
+            if score == score:
+                word["score"] = score
+            if names[speaker_id] is not None:
+                word["speaker"] = names[speaker_id]
+            if confidence == confidence:
+                word["speaker_confidence"] = confidence
+            words.append(word)
+        return words
+
+    def to_columns(self):
+        """JSON-ready dict of the columns, for storing a Transcript without going back to per-segment dicts"""
+        return {
+            "start": self.start, "end": self.end, "speaker": self.speaker, "confidence": self.confidence,
+            "speakers": self.speakers, "text": self._text, "text_offsets": self._text_offsets,
+            "word_offsets": self.word_offsets, "word_start": self.word_start, "word_end": self.word_end,
+            "word_score": self.word_score, "word_speaker": self.word_speaker, "word_confidence": self.word_confidence,
+            "word_text": self._word_text, "word_text_offsets": self._word_text_offsets,
+            "language": self.language, "extra": self.extra,
+        }
+
+    @classmethod
+    def from_columns(cls, data):
+        def column(name, dtype):
+            return np.asarray(data[name], dtype=dtype)
+
+        return cls(column("start", np.float64), column("end", np.float64), column("speaker", np.int32), data["speakers"],
+                   data["text"], column("text_offsets", np.int64), column("word_offsets", np.int64),
+                   column("word_start", np.float64), column("word_end", np.float64), column("word_score", np.float64),
+                   column("word_speaker", np.int32), data["word_text"], column("word_text_offsets", np.int64),
+                   data["language"], data["extra"], column("confidence", np.float64), column("word_confidence", np.float64))
+
+    def __len__(self):
+        return len(self.start)
+
+    def text(self, i):
+        return self._text[self._text_offsets[i]:self._text_offsets[i + 1]]
+
+    def word_text(self, j):
+        return self._word_text[self._word_text_offsets[j]:self._word_text_offsets[j + 1]]
+
+    def words(self, i):
+        """Word dicts of segment i, built on demand"""
+        return self._words(int(self.word_offsets[i]), int(self.word_offsets[i + 1]))
+
+    def speaker_name(self, i):
+        speaker_id = self.speaker[i]
+        return UNKNOWN if speaker_id == NO_SPEAKER else self.speakers[speaker_id]
+
+    def rows(self):
+        """(speaker, start, end, text) per segment, without building dicts"""
+        return self._rows(self.speakers + [UNKNOWN])
+
+    def _rows(self, names):
+        # names has one extra trailing entry, which NO_SPEAKER (-1) picks up.
+        offsets = self._text_offsets.tolist()
+        for i, (speaker_id, start, end) in enumerate(zip(self.speaker.tolist(), self.start.tolist(), self.end.tolist())):
+            yield names[speaker_id], start, end, self._text[offsets[i]:offsets[i + 1]]
+
+    def speaker_id(self, name):
+        return self._speaker_ids.get(name, NO_SPEAKER)
+
+    def segments_of(self, name):
+        """Indices of the segments spoken by name"""
+        return np.flatnonzero(self.speaker == self.speaker_id(name))
+
+    def speaker_durations(self):
+        """Total segment seconds per speaker name"""
+        known = self.speaker != NO_SPEAKER
+        totals = np.bincount(self.speaker[known], weights=(self.end - self.start)[known], minlength=len(self.speakers))
+        return dict(zip(self.speakers, totals.tolist()))
+
+    def rename_speakers(self, mapping):
+        """Rename speakers in the interned table; two labels renamed to the same name are merged"""
+        names = [mapping.get(name, name) for name in self.speakers]
+        merged = []
+        merged_ids = {}
+        remap = np.empty(len(names) + 1, dtype=np.int32)
+        remap[-1] = NO_SPEAKER
+        for old_id, name in enumerate(names):
+            if name not in merged_ids:
+                merged_ids[name] = len(merged)
+                merged.append(name)
+            remap[old_id] = merged_ids[name]
+        # NO_SPEAKER (-1) indexes the last slot, which maps back to itself.
+        self.speaker = remap[self.speaker]
+        self.word_speaker = remap[self.word_speaker]
+        self.speakers = merged
+        self._speaker_ids = merged_ids
+
+    @property
+    def nbytes(self):
+        arrays = (self.start, self.end, self.speaker, self.confidence, self._text_offsets, self.word_offsets, self.word_start,
+                  self.word_end, self.word_score, self.word_speaker, self.word_confidence, self._word_text_offsets)
+        return sum(array.nbytes for array in arrays) + sys.getsizeof(self._text) + sys.getsizeof(self._word_text)
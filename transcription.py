@@ -1,198 +1,350 @@
-import whisperx
-import gc
 import torch
 import numpy as np
-import datetime
 import time
-import pathlib
+import queue
+import threading
+import concurrent.futures
+import multiprocessing
+import models
+import events
+from timefmt import format_time
+import backend
+import audio as audio_io
+import vad
+import cache
+import diarization
+import exporters
+from transcript import Transcript
 
-device = "cpu"
-batch_size = 16
-compute_type = "float32"
+device = backend.select_device()
+batch_size = backend.default_batch_size(device)
+compute_type = backend.default_compute_type(device)
 modal = "large-v2"
+pipeline_queue_size = 2
+process_workers = 1
+threads_per_worker = 0
+vad_chunking = True
+use_cache = True
+memory_budget_bytes = None
 
-def chunk_audio(audio_path, chunk_length_s=300):
-    print(f"[chunk_audio] Loading audio from: {audio_path}")
+def chunk_audio(source, chunk_length_s=300):
+    with events.span("vad"):
+        return _chunk_audio(source, chunk_length_s)
+
+def _chunk_audio(source, chunk_length_s):
+    print(f"[chunk_audio] Planning chunks for: {source.audio_path}")
     start_time = time.time()
-    audio = whisperx.load_audio(audio_path)
-    sr = 16000
-    total_len = len(audio) / sr
+    total_len = source.duration
     print(f"[chunk_audio] Audio length: {total_len:.2f} seconds. Chunking into {chunk_length_s}s segments.")
+    if vad_chunking:
+        chunks = vad.vad_chunks(source, chunk_length_s)
+        for start, end in chunks:
+            print(f"[chunk_audio] Creating chunk: start={start:.2f}s, end={end:.2f}s")
+        print(f"[chunk_audio] Total chunks created: {len(chunks)}")
+        print(f"[chunk_audio] Done in {time.time() - start_time:.2f} seconds.")
+        return chunks
     chunks = []
     for start in np.arange(0, total_len, chunk_length_s):
         end = min(start + chunk_length_s, total_len)
-        s = int(start * sr)
-        e = int(end * sr)
         print(f"[chunk_audio] Creating chunk: start={start:.2f}s, end={end:.2f}s")
-        chunks.append((start, audio[s:e]))
+        chunks.append((float(start), float(end)))
     print(f"[chunk_audio] Total chunks created: {len(chunks)}")
     print(f"[chunk_audio] Done in {time.time() - start_time:.2f} seconds.")
     return chunks
 
-def format_time(seconds):
-    """Convert seconds to human-readable format"""
-    if seconds < 60:
-        return f"{seconds:.1f} seconds"
-    elif seconds < 3600:
-        minutes = seconds // 60
-        remaining_seconds = seconds % 60
-        return f"{int(minutes)}m {remaining_seconds:.0f}s"
-    else:
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        return f"{int(hours)}h {int(minutes)}m"
+_STOP = object()
 
-def process_audio(audio_path):
-    print(f"[process_audio] Loading model: {modal} on {device}")
-    total_start = time.time()
-    model = whisperx.load_model(modal, device, compute_type=compute_type)
-    
-    print(f"[process_audio] Chunking audio...")
-    chunks = chunk_audio(audio_path)
+class ProcessingCancelled(Exception):
+    pass
+
+def _stage_worker(name, fn, in_q, out_q, errors):
+    while True:
+        item = in_q.get()
+        if item is _STOP:
+            in_q.put(_STOP)
+            break
+        if errors:
+            continue
+        try:
+            out_q.put(fn(item))
+        except ProcessingCancelled as e:
+            errors.append(e)
+        except Exception as e:
+            print(f"[process_audio] {name} failed: {e}")
+            errors.append(e)
+
+def _start_stage(name, fn, in_q, out_q, errors):
+    thread = threading.Thread(target=_stage_worker, args=(name, fn, in_q, out_q, errors), daemon=True)
+    thread.start()
+    return thread
+
+def _init_process_worker(threads):
+    if threads:
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+
+def current_config():
+    return backend.InferenceConfig(modal, device, compute_type, batch_size)
+
+def warm_up(language="en", token=None, inference=None):
+    """Load the models a run will need, so the first job doesn't wait for them"""
+    inference = inference or current_config()
+    with events.span("warm_up"):
+        models.get_whisper_model(inference.model, language, inference.device, inference.compute_type, threads_per_worker)
+        models.get_align_model(language, inference.device)
+        if token:
+            models.get_diarize_pipeline(token, inference.device)
+
+def _transcribe_chunk_in_process(idx, start_time_chunk, end_time_chunk, cache_path, inference, language, threads):
+    chunk_audio_data = audio_io.open_samples(cache_path, int(start_time_chunk * audio_io.SAMPLE_RATE), int(end_time_chunk * audio_io.SAMPLE_RATE))
+    model = models.get_whisper_model(inference.model, language, "cpu", inference.compute_type, threads)
+    align_model = models.get_align_model(language, "cpu")
+    chunk_start = time.time()
+    with events.span("transcribe"):
+        result = models.transcribe(model, chunk_audio_data, inference.batch_size, language)
+    with events.span("align"):
+        aligned = models.align(result["segments"], align_model, chunk_audio_data, "cpu")
+    for segment in aligned["segments"]:
+        segment["start"] += start_time_chunk
+        segment["end"] += start_time_chunk
+    return idx, aligned["segments"], time.time() - chunk_start
+
+def _process_chunks_in_pool(source, chunks, todo, inference, language, processes, threads, on_chunk_done, cancel_event=None):
+    # Each worker process holds its own copy of the models, so RAM grows with
+    # processes; threads pins CTranslate2's and torch's threads in each one so
+    # processes x threads ~= cores.
+    print(f"[process_audio] Transcribing {len(todo)} chunks across {processes} processes ({threads or 'default'} threads each)")
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                                                initializer=_init_process_worker, initargs=(threads,)) as pool:
+        pending = set()
+        chunk_iter = iter(todo)
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    for future in pending:
+                        future.cancel()
+                    break
+                # Keep at most two chunks in flight per process so queued audio stays bounded.
+                while len(pending) < processes * 2:
+                    idx = next(chunk_iter, None)
+                    if idx is None:
+                        break
+                    # Workers map the decoded cache file themselves instead of receiving pickled audio.
+                    start_time_chunk, end_time_chunk = chunks[idx]
+                    pending.add(pool.submit(_transcribe_chunk_in_process, idx, start_time_chunk, end_time_chunk, str(source.cache_path), inference, language, threads))
+                if not pending:
+                    break
+                finished, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    on_chunk_done(*future.result())
+        except BaseException:
+            # A failed chunk or callback ends the run; queued chunks are
+            # dropped instead of being transcribed for nobody.
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+    if cancel_event is not None and cancel_event.is_set():
+        raise ProcessingCancelled()
+
+def _process_chunks_in_threads(source, chunks, todo, inference, language, on_chunk_done, cancel_event=None, threads=0):
+    print(f"[process_audio] Loading model: {inference.model} ({inference.compute_type}) on {inference.device}")
+    model = models.get_whisper_model(inference.model, language, inference.device, inference.compute_type, threads)
+    print(f"[process_audio] Loading alignment model for language: {language}")
+    align_model = models.get_align_model(language, inference.device)
     total_chunks = len(chunks)
     
-    all_segments = []
-    language = "en"
+    # transcribe -> align, connected by a bounded queue so chunk N+1 is
+    # transcribed while chunk N is still being aligned. The audio was decoded
+    # up front, so reading a chunk is only a slice of the memory map. There is
+    # one align worker because the alignment model is shared and wav2vec2
+    # inference is not documented as safe to call from several threads.
+    todo_q = queue.Queue()
+    for idx in todo:
+        todo_q.put(idx)
+    todo_q.put(_STOP)
+    transcribed_q = queue.Queue(maxsize=pipeline_queue_size)
+    aligned_q = queue.Queue()
+    errors = []
     
-    for idx, (start_time_chunk, chunk_audio_data) in enumerate(chunks):
+    def transcribe(idx):
+        if cancel_event is not None and cancel_event.is_set():
+            raise ProcessingCancelled()
         chunk_start = time.time()
+        start_time_chunk, end_time_chunk = chunks[idx]
+        chunk_audio_data = source.read(start_time_chunk, end_time_chunk)
         print(f"[process_audio] Transcribing chunk {idx+1}/{total_chunks} (start={start_time_chunk:.2f}s)")
-        
-        result = model.transcribe(chunk_audio_data, batch_size=batch_size, language=language)
-        print(f"[process_audio] Loading alignment model for language: {language}")
-        model_a, metadata = whisperx.load_align_model(language_code=language, device=device)
+        with events.span("transcribe"):
+            result = models.transcribe(model, chunk_audio_data, inference.batch_size, language)
+        return idx, start_time_chunk, chunk_audio_data, chunk_start, result
+    
+    def align(item):
+        idx, start_time_chunk, chunk_audio_data, chunk_start, result = item
         print(f"[process_audio] Aligning segments for chunk {idx+1}")
-        aligned = whisperx.align(result["segments"], model_a, metadata, chunk_audio_data, device, return_char_alignments=False)
-        
+        with events.span("align"):
+            aligned = models.align(result["segments"], align_model, chunk_audio_data, inference.device)
         for segment in aligned["segments"]:
             segment["start"] += start_time_chunk
             segment["end"] += start_time_chunk
-        all_segments.extend(aligned["segments"])
-        
-        chunk_time = time.time() - chunk_start
-        print(f"[process_audio] Finished chunk {idx+1}, segments so far: {len(all_segments)} (chunk time: {format_time(chunk_time)})")
-        
-        if idx == 0:
-            remaining_chunks = total_chunks - 1
-            estimated_remaining_time = chunk_time * remaining_chunks
-            estimated_total_time = chunk_time * total_chunks
-            
-            print(f"[time_estimate] Based on first chunk ({format_time(chunk_time)}):")
-            print(f"[time_estimate] - Remaining chunks: {remaining_chunks}")
-            print(f"[time_estimate] - Estimated remaining time: {format_time(estimated_remaining_time)}")
-            print(f"[time_estimate] - Estimated total processing time: {format_time(estimated_total_time)}")
-        
-        elif idx > 0 and (idx + 1) % 3 == 0:
-            elapsed_processing = time.time() - total_start
-            avg_chunk_time = elapsed_processing / (idx + 1)
-            remaining_chunks = total_chunks - (idx + 1)
-            updated_estimate = elapsed_processing + (avg_chunk_time * remaining_chunks)
-            
-            print(f"[time_estimate] Average chunk time so far: {format_time(avg_chunk_time)}")
-            print(f"[time_estimate] Updated estimated total time: {format_time(updated_estimate)}")
-        
-        gc.collect()
+        return idx, aligned["segments"], time.time() - chunk_start
+    
+    transcribe_thread = _start_stage("transcribe", transcribe, todo_q, transcribed_q, errors)
+    align_thread = _start_stage("align", align, transcribed_q, aligned_q, errors)
+    
+    def finish():
+        transcribe_thread.join()
+        transcribed_q.put(_STOP)
+        align_thread.join()
+        aligned_q.put(_STOP)
+    
+    threading.Thread(target=finish, daemon=True).start()
+    
+    try:
+        while True:
+            item = aligned_q.get()
+            if item is _STOP:
+                break
+            on_chunk_done(*item)
+    except BaseException as e:
+        # Nobody reads the results any more; the stage workers skip the
+        # remaining chunks instead of transcribing them for nothing.
+        errors.append(e)
+        raise
+    
+    if errors:
+        raise errors[0]
+    if cancel_event is not None and cancel_event.is_set():
+        raise ProcessingCancelled()
+
+def process_audio(audio_path, language="en", processes=None, threads=None, cancel_event=None, on_progress=None, inference=None,
+                  on_segments=None, budget=None):
+    inference = inference or current_config()
+    processes = processes or process_workers
+    threads = threads if threads is not None else threads_per_worker
+    total_start = time.time()
+    source = audio_io.AudioSource(audio_path)
+    
+    audio_hash = cache.file_hash(audio_path) if use_cache else None
+    
+    print("[process_audio] Chunking audio...")
+    chunk_length_s = 300
+    if budget:
+        inference, chunk_length_s = budget.plan(inference, chunk_length_s)
+    chunks = chunk_audio(source, chunk_length_s)
+    total_chunks = len(chunks)
+    
+    chunk_segments = {}
+    if audio_hash:
+        for idx, (start_time_chunk, end_time_chunk) in enumerate(chunks):
+            segments = cache.load_chunk(audio_hash, start_time_chunk, end_time_chunk, inference.cache_name, language)
+            if segments is not None:
+                chunk_segments[idx] = segments
+        if chunk_segments:
+            print(f"[process_audio] Resuming: {len(chunk_segments)}/{total_chunks} chunks already cached.")
+    todo = [idx for idx in range(total_chunks) if idx not in chunk_segments]
+    
+    progress = {"segments": sum(len(segments) for segments in chunk_segments.values())}
+    estimator = events.EtaEstimator(len(todo))
+    stitched = {"next": 0, "last": None}
+
+    def stream_ready_chunks():
+        # Chunks can finish out of order; only the finished prefix is stitched and handed on.
+        while on_segments and stitched["next"] in chunk_segments:
+            idx = stitched["next"]
+            segments = vad.stitch_chunk(chunks, idx, chunk_segments[idx], stitched["last"])
+            if segments:
+                stitched["last"] = segments[-1]
+                on_segments(segments)
+            stitched["next"] += 1
+
+    stream_ready_chunks()
+
+    def on_chunk_done(idx, segments, chunk_time):
+        chunk_segments[idx] = segments
+        stream_ready_chunks()
+        if budget:
+            budget.check(inference)
+        if audio_hash:
+            start_time_chunk, end_time_chunk = chunks[idx]
+            cache.save_chunk(audio_hash, start_time_chunk, end_time_chunk, inference.cache_name, language, segments)
+        progress["segments"] += len(segments)
+        eta = estimator.update()
+        print(f"[process_audio] Finished chunk {idx+1} ({len(chunk_segments)}/{total_chunks}), segments so far: {progress['segments']} (chunk time: {format_time(chunk_time)})")
+        events.emit("chunk_done", file=audio_path, index=idx, done=len(chunk_segments), total=total_chunks,
+                    segments=len(segments), chunk_seconds=chunk_time, average=estimator.average, eta=eta)
+        if on_progress:
+            on_progress(len(chunk_segments), total_chunks, eta)
+    
+    if todo and processes > 1 and inference.device == "cpu":
+        _process_chunks_in_pool(source, chunks, todo, inference, language, processes, threads, on_chunk_done, cancel_event)
+    elif todo:
+        _process_chunks_in_threads(source, chunks, todo, inference, language, on_chunk_done, cancel_event, threads)
+    
+    return _combine_chunks(source, chunks, chunk_segments, language, total_start, audio_hash)
+
+def _combine_chunks(source, chunks, chunk_segments, language, total_start, audio_hash=None):
+    all_segments = vad.stitch_segments(chunks, chunk_segments)
+    # The stitched list now owns every kept segment; drop the per-chunk lists
+    # (and the overlap duplicates only they reference) right away.
+    chunk_segments.clear()
+    if torch.cuda.is_available():
         torch.cuda.empty_cache()
-        del model_a
     
     print(f"[process_audio] Combining all segments. Total segments: {len(all_segments)}")
-    combined_result = {"segments": all_segments, "language": language}
-    
-    print(f"[process_audio] Reloading full audio for output.")
-    audio = whisperx.load_audio(audio_path)
+    combined_result = {"segments": all_segments, "language": language, "audio_hash": audio_hash}
     
     total_time = time.time() - total_start
     print(f"[process_audio] Done. Total processing time: {format_time(total_time)}")
     
-    return audio, combined_result
+    # The memory-mapped samples double as the diarization input, so the full
+    # recording is never held twice in RAM.
+    return source.samples, combined_result
 
-def diarize_results(token, audio, result_from_whisper):
-    print(f"[diarize_results] Loading diarization pipeline.")
+def diarize_results(token, audio, result_from_whisper, min_speakers=None, max_speakers=None, inference=None):
     start_time = time.time()
-    diarize_model = whisperx.diarize.DiarizationPipeline(use_auth_token=token, device=device)
-    print(f"[diarize_results] Running diarization on audio.")
-    diarize_segments = diarize_model(audio)
-    print(f"[diarize_results] Assigning speakers to words.")
-    result = whisperx.assign_word_speakers(diarize_segments, result_from_whisper)
+    turns = diarize_turns(token, audio, result_from_whisper.get("audio_hash"), min_speakers, max_speakers, inference)
+    result = assign_speakers(turns, result_from_whisper)
     print(f"[diarize_results] Done in {time.time() - start_time:.2f} seconds.")
     return result
+
+def diarize_turns(token, audio, audio_hash=None, min_speakers=None, max_speakers=None, inference=None):
+    # The job's device, so --device cpu keeps diarization off the GPU and
+    # shares the pipeline warm_up loaded for the same config.
+    inference = inference or current_config()
+    print("[diarize_results] Diarizing audio.")
+    with events.span("diarize"):
+        return diarization.diarize(token, audio, inference.device, audio_hash, min_speakers, max_speakers)
+
+def assign_speakers(turns, result_from_whisper):
+    print("[diarize_results] Assigning speakers to words.")
+    with events.span("assign_speakers"):
+        return diarization.assign_word_speakers(turns, result_from_whisper)
     
 def display_results(result):
-    print(f"[display_results] Displaying transcription results:")
+    print("[display_results] Displaying transcription results:")
     start_time = time.time()
-    for segment in result["segments"]:
-        speaker = segment.get("speaker", "Unknown")
-        start = segment["start"]
-        end = segment["end"]
-        text = segment["text"]
+    for speaker, start, end, text in Transcript.from_result(result).rows():
         print(f"{speaker} [{start:.2f}-{end:.2f}]: {text}")
     print(f"[display_results] Done displaying in {time.time() - start_time:.2f} seconds.")
 
-def output_results_to_file(result, file_name, file_type):
+def output_results_to_file(transcript, file_name, file_type, open_file=True, output_dir=None, speaker_map=None):
+    """Name speakers and export a Transcript; file_type is a format number, name or list of names
+
+    speaker_map skips name detection and applies an already known label-to-name mapping.
+    Returns {format: path} for every file written.
+    """
     import diarize;
-    diarize.update_speaker_names(result)
-    documents_folder = pathlib.Path.home() / "Documents"
-    transcriptions_folder = documents_folder / "transcriptions"
-    transcriptions_folder.mkdir(parents=True, exist_ok=True)
-    
-    output_path = None
-    if file_type == 1:
-        output_path = markdown(transcriptions_folder, result, file_name)
-    if file_type == 2:
-        output_path = html(transcriptions_folder, result, file_name)
-    if file_type == 3:
-        output_path = txt(transcriptions_folder, result, file_name)
+    if speaker_map is None:
+        diarize.update_speaker_names(transcript)
+    else:
+        diarize.apply_speaker_names(transcript, speaker_map)
+    paths = exporters.export(transcript, exporters.transcriptions_dir(output_dir), file_name, file_type)
 
-    try:
+    if open_file:
         import subprocess
-        subprocess.Popen(['xdg-open', str(output_path)])
-        print(f"[output_results_to_file] Opened {output_path} in the default viewer.")
-    except Exception as e:
-        print(f"[output_results_to_file] Could not open file: {e}")
-        
-        
-def markdown(transcriptions_folder, result, file_name):
-    dt = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_path = transcriptions_folder / f"{file_name}_{dt}.md"
-    print(f"[output_results_to_file] Writing results to {output_path} (Markdown format)")
-    start_time = time.time()
-    with open(output_path, "w") as f:
-        for segment in result["segments"]:
-            speaker = segment.get("speaker", "Unknown")
-            start = segment["start"]
-            end = segment["end"]
-            text = segment["text"]
-            f.write(f"**{speaker}** [{start:.2f}-{end:.2f}]: {text}\n")
-    print(f"[output_results_to_file] Done writing in {time.time() - start_time:.2f} seconds.")
-    return output_path
-
-def html(transcriptions_folder, result, file_name):
-    dt = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_path = transcriptions_folder / f"{file_name}_{dt}.html"
-    print(f"[output_results_to_file] Writing results to {output_path} (HTML format)")
-    start_time = time.time()
-    with open(output_path, "w") as f:
-        for segment in result["segments"]:
-            speaker = segment.get("speaker", "Unknown")
-            start = segment["start"]
-            end = segment["end"]
-            text = segment["text"]
-            f.write(f"<b>{speaker}</b> [{start:.2f}-{end:.2f}]: {text}\n")
-    print(f"[output_results_to_file] Done writing in {time.time() - start_time:.2f} seconds.")
-    return output_path
-
-
-def txt(transcriptions_folder, result, file_name):
-    dt = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_path = transcriptions_folder / f"{file_name}_{dt}.txt"
-    print(f"[output_results_to_file] Writing results to {output_path} (Text format)")
-    start_time = time.time()
-    with open(output_path, "w") as f:
-        for segment in result["segments"]:
-            speaker = segment.get("speaker", "Unknown")
-            start = segment["start"]
-            end = segment["end"]
-            text = segment["text"]
-            f.write(f"{speaker} [{start:.2f}-{end:.2f}]: {text}\n")
-    print(f"[output_results_to_file] Done writing in {time.time() - start_time:.2f} seconds.")
-    return output_path
+        for output_path in paths.values():
+            try:
+                subprocess.Popen(['xdg-open', str(output_path)])
+                print(f"[output_results_to_file] Opened {output_path} in the default viewer.")
+            except Exception as e:
+                print(f"[output_results_to_file] Could not open file: {e}")
+    return paths
@@ -3,14 +3,39 @@ import tkinter as tk
 from tkinter import filedialog
 import threading
 import sys
+import logging.handlers
 import queue
 import pathlib
-import requests
-import pathlib
-import transcription
-import unknown_handler
-import pathlib
+import config
+import events
+import jobs
 import time
+from timefmt import format_time
+
+# whisperx, torch and requests take seconds to import, so they are only loaded
+# on first use (pipeline, transcription and live are imported in the functions
+# that need them) and the window can appear right away.
+
+max_console_lines = 2000
+max_messages_per_tick = 5000
+log_file = config.config_dir / "logs" / "dungeon-scribe.log"
+log_bytes = 5 * 2**20
+log_backups = 3
+
+class ConsoleLog:
+    """Full console output in a size-rotated file, since the textbox only keeps the tail"""
+
+    def __init__(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=log_bytes, backupCount=log_backups, encoding="utf-8")
+        self.handler.terminator = ""
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def write(self, text):
+        self.handler.emit(logging.makeLogRecord({"msg": text}))
+
+    def close(self):
+        self.handler.close()
 
 class ConsoleRedirector:
     def __init__(self, textbox, q):
@@ -23,20 +48,28 @@ class ConsoleRedirector:
     def flush(self):
         pass
 
- #todo - move this into the main and have it disable buttons while running
-
 class DungeonListenerApp(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.title("Dungeon Scribe")
-        self.geometry("700x500")
+        self.geometry("700x700")
         self.resizable(False, False)
 
-        self.grid_rowconfigure(5, weight=1)
+        self.grid_rowconfigure(6, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
-        self.select_button = ctk.CTkButton(self, text="Select Audio File", command=self.select_file)
-        self.select_button.grid(row=1, column=0, pady=(10, 10), sticky="n")
+        button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        button_frame.grid(row=1, column=0, pady=(10, 10), sticky="n")
+        self.select_button = ctk.CTkButton(button_frame, text="Select Audio Files", command=self.select_file)
+        self.select_button.pack(side="left", padx=(0, 10))
+        self.live_button = ctk.CTkButton(button_frame, text="● Record Live", command=self.toggle_live)
+        self.live_button.pack(side="left")
+        self.live_session = None
+
+        self.warm_up = tk.BooleanVar(value=config.load_setting("warm_up") == "1")
+        self.warm_up_box = ctk.CTkCheckBox(button_frame, text="Preload models", variable=self.warm_up, command=self.toggle_warm_up)
+        self.warm_up_box.pack(side="left", padx=(10, 0))
+        self.warm_up_started = False
 
         self.token_icon = "❌"
         self.token_button = ctk.CTkButton(self, text=f"{self.token_icon} Set Token", command=self.set_token)
@@ -57,7 +90,16 @@ class DungeonListenerApp(ctk.CTk):
         self.transcript_format_html.pack(side="left", padx=(0, 8))
 
         self.transcript_format_txt = ctk.CTkRadioButton(transcript_frame, text="Text", variable=self.transript_type, value=3)
-        self.transcript_format_txt.pack(side="left")
+        self.transcript_format_txt.pack(side="left", padx=(0, 8))
+
+        self.transcript_format_srt = ctk.CTkRadioButton(transcript_frame, text="SRT", variable=self.transript_type, value=4)
+        self.transcript_format_srt.pack(side="left", padx=(0, 8))
+
+        self.transcript_format_vtt = ctk.CTkRadioButton(transcript_frame, text="VTT", variable=self.transript_type, value=5)
+        self.transcript_format_vtt.pack(side="left", padx=(0, 8))
+
+        self.transcript_format_json = ctk.CTkRadioButton(transcript_frame, text="JSON", variable=self.transript_type, value=6)
+        self.transcript_format_json.pack(side="left")
 
         transcript_name_frame = ctk.CTkFrame(self, fg_color="transparent")
         transcript_name_frame.grid(row=4, column=0, pady=(10, 0), sticky="w")
@@ -66,128 +108,250 @@ class DungeonListenerApp(ctk.CTk):
         self.transcript_name = tk.StringVar(value="Session")
         self.transcript_name_input = ctk.CTkEntry(transcript_name_frame, width=200, textvariable=self.transcript_name)
         self.transcript_name_input.pack(side="left", padx=(0, 10))
+        self.memory_budget_label = ctk.CTkLabel(transcript_name_frame, text="Memory Budget (GB):")
+        self.memory_budget_label.pack(side="left", padx=(10, 10))
+        # Empty means no limit; saved when editing ends so the job worker can read it.
+        self.memory_budget = tk.StringVar(value=config.load_setting("memory_budget_gb", ""))
+        self.memory_budget_input = ctk.CTkEntry(transcript_name_frame, width=60, textvariable=self.memory_budget)
+        self.memory_budget_input.pack(side="left")
+        self.memory_budget_input.bind("<FocusOut>", self.save_memory_budget)
+        self.memory_budget_input.bind("<Return>", self.save_memory_budget)
+
+        self.job_frame = ctk.CTkScrollableFrame(self, width=650, height=150, label_text="Jobs")
+        self.job_frame.grid(row=5, column=0, columnspan=2, padx=10, pady=(10, 10), sticky="nsew")
+        self.job_frame.grid_columnconfigure(0, weight=1)
+        self.job_rows = {}
+        self.job_progress = {}
 
-        self.console_text = ctk.CTkTextbox(self, width=650, height=350, font=("Consolas", 12), wrap="word")
-        self.console_text.grid(row=5, column=0, columnspan=2, padx=10, pady=(0, 20), sticky="nsew")
+        self.console_text = ctk.CTkTextbox(self, width=650, height=300, font=("Consolas", 12), wrap="word")
+        self.console_text.grid(row=6, column=0, columnspan=2, padx=10, pady=(0, 20), sticky="nsew")
         self.console_text.configure(state="disabled")
 
+        # A single long-lived worker runs jobs back-to-back, so models loaded
+        # for the first job stay warm for the rest.
+        self.job_queue = jobs.JobQueue(self.run_job, on_change=self.on_job_change)
+
         self.print_queue = queue.Queue()
+        self.log = ConsoleLog(log_file)
         sys.stdout = ConsoleRedirector(self.console_text, self.print_queue)
         sys.stderr = ConsoleRedirector(self.console_text, self.print_queue)
 
+        # Progress comes from the event bus rather than from parsing the console;
+        # stdout already goes to the console, so the CLI's printer fits as is.
+        events.subscribe(self.on_event)
+        events.subscribe(events.console_printer)
+
         self.after(100, self.update_console)
         self.after(200, self.check_token_status)
+        if self.warm_up.get():
+            self.after(300, self.start_warm_up)
+
+    def run_job(self, job):
+        import budget
+        import pipeline
+        import transcription
+        token = config.load_token()
+        if not token:
+            raise RuntimeError("HuggingFace token not set. Please set your token first.")
+        try:
+            limit = float(config.load_setting("memory_budget_gb") or 0)
+        except ValueError:
+            raise RuntimeError("Memory budget must be a number of GB, or empty for no limit.")
+        transcription.memory_budget_bytes = int(limit * budget.GB) if limit > 0 else None
+        self.print_queue.put(f"[UI] Starting job {job.id}: {job.audio_path}\n")
+        start_time = time.time()
+        output_paths = pipeline.run_pipeline(job.audio_path, token, job.file_name, job.file_type,
+                                             cancel_event=job.cancel_event)
+        elapsed = time.time() - start_time
+        self.print_queue.put(f"[UI] Job {job.id} finished in {elapsed:.2f} seconds.\n")
+        return output_paths
 
-    def process_audio_thread(self, audio_path, print_queue, file_name, file_type):
-            self.select_button.configure(state=tk.DISABLED)
-            self.token_button.configure(state=tk.DISABLED)
-            self.transcript_name_input.configure(state=tk.DISABLED)
-            self.transcript_format_md.configure(state=tk.DISABLED)
-            self.transcript_format_html.configure(state=tk.DISABLED)
-            self.transcript_format_txt.configure(state=tk.DISABLED)
-
-            config_dir = pathlib.Path.home() / ".dungeon-scribe"
-            config_file = config_dir / "config"
-            token = None
-            if config_file.exists():
-                with open(config_file, "r") as f:
-                    for line in f:
-                        if line.startswith("hf_token="):
-                            token = line.strip().split("=", 1)[1]
-                            break
-
-            if not token:
-                print_queue.put("[UI] Error: HuggingFace token not set. Please set your token first.\n")
-                return
-
-            try:
-                print_queue.put("[UI] Starting transcription...\n")
-                start_time = time.time()
-                audio, result = transcription.process_audio(audio_path)
-                print_queue.put("[UI] Starting diarization...\n")
-                diarized = transcription.diarize_results(token, audio, result)
-                print_queue.put("[UI] Handling unknown speakers...\n")
-                finalized = unknown_handler.handle_unknown_speakers(diarized)
-                print_queue.put("[UI] Saving results to file...\n")
-                transcription.output_results_to_file(finalized, file_name, file_type)
-                elapsed = time.time() - start_time
-                print_queue.put("[UI] Transcription and diarization complete.\n")
-                print_queue.put(f"[UI] Transcription finished in {elapsed:.2f} seconds.\n")
-                
-            except Exception as e:
-                print_queue.put(f"[UI] Error: {e}\n")
-                
-            finally:
-                self.select_button.configure(state=tk.NORMAL)
-                self.token_button.configure(state=tk.NORMAL)
-                self.transcript_name_input.configure(state=tk.NORMAL)
-                self.transcript_format_md.configure(state=tk.NORMAL)
-                self.transcript_format_html.configure(state=tk.NORMAL)
-                self.transcript_format_txt.configure(state=tk.NORMAL)
-        
     def select_file(self):
+        # Clicking a button doesn't take focus from the entry, so save here too.
+        self.save_memory_budget()
         documents_folder = str(pathlib.Path.home() / "Documents")
-        file_path = filedialog.askopenfilename(
+        file_paths = filedialog.askopenfilenames(
             initialdir=documents_folder,
-            title="Select Audio File",
+            title="Select Audio Files",
             filetypes=[("Audio Files", "*.wav *.mp3 *.m4a *.flac *.ogg"), ("All Files", "*.*")]
         )
-        if file_path:
-            self.console_text.configure(state="normal")
-            self.console_text.insert(tk.END, f"[UI] Selected file: {file_path}\n")
-            self.console_text.configure(state="disabled")
-            threading.Thread(target=self.process_audio_thread, args=(file_path, self.print_queue, self.transcript_name.get(), self.transript_type.get()), daemon=True).start()
+        for file_path in file_paths:
+            self.print_queue.put(f"[UI] Queued file: {file_path}\n")
+            self.job_queue.submit(jobs.Job(file_path, self.transcript_name.get(), self.transript_type.get()))
+
+    def on_job_change(self, job):
+        # Called from the queue's worker thread; widgets are only touched on the Tk loop.
+        self.after(0, self.refresh_jobs)
+
+    def on_event(self, event):
+        if event["type"] == "chunk_done":
+            self.after(0, self.show_progress, event)
+
+    def show_progress(self, event):
+        job = next((job for job in self.job_queue.jobs() if job.status == jobs.RUNNING and job.audio_path == event["file"]), None)
+        if job is not None:
+            self.job_progress[job.id] = event
+            if job.id in self.job_rows:
+                self.job_rows[job.id][0].configure(text=self.job_text(job))
+
+    def job_text(self, job):
+        name = pathlib.Path(job.audio_path).name
+        text = f"#{job.id} {name} — {job.status}"
+        progress = self.job_progress.get(job.id)
+        if job.status == jobs.RUNNING and progress:
+            text += f" {progress['done'] / progress['total']:.0%}"
+            if progress["eta"] is not None:
+                text += f", ETA {format_time(progress['eta'])}"
+        elif job.status == jobs.FAILED:
+            text += f": {job.error}"
+        return text
+
+    def refresh_jobs(self):
+        current = self.job_queue.jobs()
+        current_ids = [job.id for job in current]
+        for job_id in list(self.job_rows):
+            if job_id not in current_ids:
+                for widget in self.job_rows.pop(job_id):
+                    widget.destroy()
+        for row, job in enumerate(current):
+            if job.id not in self.job_rows:
+                label = ctk.CTkLabel(self.job_frame, anchor="w")
+                up = ctk.CTkButton(self.job_frame, text="▲", width=28, command=lambda job_id=job.id: self.move_job(job_id, -1))
+                down = ctk.CTkButton(self.job_frame, text="▼", width=28, command=lambda job_id=job.id: self.move_job(job_id, 1))
+                cancel = ctk.CTkButton(self.job_frame, text="✕", width=28, command=lambda job_id=job.id: self.cancel_job(job_id))
+                self.job_rows[job.id] = (label, up, down, cancel)
+            label, up, down, cancel = self.job_rows[job.id]
+            label.configure(text=self.job_text(job))
+            label.grid(row=row, column=0, sticky="we", padx=(5, 5))
+            up.grid(row=row, column=1, padx=2)
+            down.grid(row=row, column=2, padx=2)
+            cancel.grid(row=row, column=3, padx=(2, 5))
+            queued = tk.NORMAL if job.status == jobs.QUEUED else tk.DISABLED
+            up.configure(state=queued)
+            down.configure(state=queued)
+            cancel.configure(state=tk.NORMAL if job.status in (jobs.QUEUED, jobs.RUNNING) else tk.DISABLED)
+
+    def move_job(self, job_id, offset):
+        self.job_queue.move(job_id, offset)
+
+    def cancel_job(self, job_id):
+        if self.job_queue.cancel(job_id):
+            self.print_queue.put(f"[UI] Cancelling job {job_id}. Finished chunks stay cached for a later run.\n")
+
+    def toggle_live(self):
+        import live
+        if self.live_session is None:
+            self.live_button.configure(state=tk.DISABLED)
+            threading.Thread(target=self.start_live, args=(live,), daemon=True).start()
+            return
+        session = self.live_session
+        self.live_session = None
+        self.live_button.configure(state=tk.DISABLED, text="● Record Live")
+        threading.Thread(target=self.stop_live, args=(session,), daemon=True).start()
+
+    def start_live(self, live):
+        try:
+            path = live.default_recording_path(self.transcript_name.get())
+            session = live.LiveSession(path)
+            session.start()
+            self.live_session = session
+            self.after(0, lambda: self.live_button.configure(state=tk.NORMAL, text="■ Stop Recording"))
+        except Exception as e:
+            self.print_queue.put(f"[UI] Could not start live recording: {e}\n")
+            self.after(0, lambda: self.live_button.configure(state=tk.NORMAL))
+
+    def stop_live(self, session):
+        path = session.stop()
+        # Queue the finished recording so it gets the full aligned and diarized pass.
+        self.job_queue.submit(jobs.Job(str(path), self.transcript_name.get(), self.transript_type.get()))
+        self.print_queue.put(f"[UI] Queued live recording {path} for full transcription.\n")
+        self.after(0, lambda: self.live_button.configure(state=tk.NORMAL))
 
     def update_console(self):
-        while not self.print_queue.empty():
-            message = self.print_queue.get()
+        # Everything queued since the last tick becomes one insert, and the
+        # textbox only keeps the newest max_console_lines lines.
+        messages = []
+        try:
+            while len(messages) < max_messages_per_tick:
+                messages.append(self.print_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if messages:
+            text = "".join(messages)
+            self.log.write(text)
+            if text.count("\n") > max_console_lines:
+                text = "\n".join(text.split("\n")[-max_console_lines - 1:])
+            following = self.console_text.yview()[1] >= 1.0
             self.console_text.configure(state="normal")
-            self.console_text.insert(tk.END, message)
-            self.console_text.see(tk.END)
+            self.console_text.insert(tk.END, text)
+            excess = int(self.console_text.index("end-1c").split(".")[0]) - max_console_lines
+            if excess > 0:
+                self.console_text.delete("1.0", f"{excess + 1}.0")
+            if following:
+                self.console_text.see(tk.END)
             self.console_text.configure(state="disabled")
         self.after(100, self.update_console)
    
     def set_token(self):
         token = tk.simpledialog.askstring("HuggingFace Token", "Enter your HuggingFace token:", show="*")
         if token:
-            config_dir = pathlib.Path.home() / ".dungeon-scribe"
-            config_dir.mkdir(exist_ok=True)
-            config_file = config_dir / "config"
-            with open(config_file, "w") as f:
-                f.write(f"hf_token={token}\n")
-            self.console_text.configure(state="normal")
-            self.console_text.insert(tk.END, "[UI] HuggingFace token saved to config.\n")
-            self.console_text.configure(state="disabled")
+            config.save_token(token)
+            self.print_queue.put("[UI] HuggingFace token saved to config.\n")
             self.check_token_status()
         else:
             self.token_status.configure(text="❌")
 
+    def save_memory_budget(self, event=None):
+        value = self.memory_budget.get().strip()
+        if value != (config.load_setting("memory_budget_gb") or ""):
+            config.save_setting("memory_budget_gb", value)
+
+    def toggle_warm_up(self):
+        config.save_setting("warm_up", "1" if self.warm_up.get() else "0")
+        if self.warm_up.get():
+            self.start_warm_up()
+
+    def start_warm_up(self):
+        if self.warm_up_started:
+            return
+        self.warm_up_started = True
+        threading.Thread(target=self.run_warm_up, daemon=True).start()
+
+    def run_warm_up(self):
+        # Runs while the user is still picking files; a job that starts meanwhile
+        # waits on the model cache lock instead of loading a second copy.
+        self.print_queue.put("[UI] Preloading models in the background...\n")
+        start_time = time.time()
+        try:
+            import transcription
+            transcription.warm_up(token=config.load_token())
+            self.print_queue.put(f"[UI] Models ready in {time.time() - start_time:.2f} seconds.\n")
+        except Exception as e:
+            self.print_queue.put(f"[UI] Could not preload models: {e}\n")
+
     def check_token_status(self):
-        config_dir = pathlib.Path.home() / ".dungeon-scribe"
-        config_file = config_dir / "config"
-        token = None
-        if config_file.exists():
-            with open(config_file, "r") as f:
-                for line in f:
-                    if line.startswith("hf_token="):
-                        token = line.strip().split("=", 1)[1]
-                        break
-        if token and self.validate_hf_token(token):
+        # The whoami request can take seconds on a slow network, so it runs off the UI thread.
+        threading.Thread(target=self.validate_saved_token, daemon=True).start()
+
+    def validate_saved_token(self):
+        token = config.load_token()
+        valid = bool(token) and self.validate_hf_token(token)
+        self.after(0, lambda: self.show_token_status(token, valid))
+
+    def show_token_status(self, token, valid):
+        if valid:
             self.token_icon = "✅"
             self.token_button.configure(text=f"{self.token_icon} Set Token")
-            self.console_text.configure(state="normal")
-            self.console_text.insert(tk.END, "[UI] HuggingFace token is valid.\n")
-            self.console_text.configure(state="disabled")
+            self.print_queue.put("[UI] HuggingFace token is valid.\n")
         else:
             self.token_icon = "❌"
             self.token_button.configure(text=f"{self.token_icon} Set Token")
             if token:
-                self.console_text.configure(state="normal")
-                self.console_text.insert(tk.END, "[UI] HuggingFace token is invalid.\n")
-                self.console_text.configure(state="disabled")
+                self.print_queue.put("[UI] HuggingFace token is invalid.\n")
 
     def validate_hf_token(self, token):
         try:
+            import requests
             headers = {"Authorization": f"Bearer {token}"}
             response = requests.get("https://huggingface.co/api/whoami-v2", headers=headers, timeout=5)
             return response.status_code == 200
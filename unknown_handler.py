@@ -1,76 +1,97 @@
-def handle_unknown_speakers(result, max_gap_seconds=5.0, look_ahead=2):
-    if not result.get("segments"):
-        return result
-    
-    segments = result["segments"]
-    
-    for i, segment in enumerate(segments):
-        if segment.get("speaker", "Unknown") == "Unknown":
-            prev_speaker = get_previous_known_speaker(segments, i)
-            next_speaker = get_next_known_speaker(segments, i, look_ahead)
-            
-            if (prev_speaker and next_speaker and 
-                prev_speaker == next_speaker and
-                is_within_time_gap(segments, i, max_gap_seconds)):
-                segment["speaker"] = prev_speaker
-            
-            elif (prev_speaker and 
-                  is_within_time_gap(segments, i, max_gap_seconds) and
-                  should_assign_to_previous(segments, i, max_gap_seconds)):
-                segment["speaker"] = prev_speaker
-    
-    return result
+import numpy as np
 
-def should_assign_to_previous(segments, current_index, max_gap_seconds):
-    if current_index == 0:
-        return False
-    
-    current_segment = segments[current_index]
-    prev_segment = segments[current_index - 1]
-    
-    current_start = current_segment.get("start", 0)
-    prev_end = prev_segment.get("end", current_start)
-    time_gap = current_start - prev_end
-    
-    if time_gap > max_gap_seconds:
-        return False
-    
-    current_text = current_segment.get("text", "").strip().lower()
-    
-    if len(current_text) <= 10:
-        return True
-    
-    filler_words = {"um", "uh", "ah", "hmm", "yeah", "yes", "no", "okay", "ok", "right", "sure"}
-    if current_text in filler_words:
-        return True
-    
-    continuation_words = {"and", "but", "so", "because", "however", "also", "then", "now"}
-    first_word = current_text.split()[0] if current_text.split() else ""
-    if first_word in continuation_words:
-        return True
-    
-    return True
+from transcript import NO_SPEAKER, UNKNOWN
 
-def get_previous_known_speaker(segments, current_index):
-    for i in range(current_index - 1, -1, -1):
-        speaker = segments[i].get("speaker", "Unknown")
-        if speaker != "Unknown":
-            return speaker
-    return None
+FILLER_WORDS = {"um", "uh", "ah", "hmm", "yeah", "yes", "no", "okay", "ok", "right", "sure"}
+CONTINUATION_WORDS = {"and", "but", "so", "because", "however", "also", "then", "now"}
 
-def get_next_known_speaker(segments, current_index, look_ahead):
-    end_index = min(current_index + look_ahead + 1, len(segments))
-    for i in range(current_index + 1, end_index):
-        speaker = segments[i].get("speaker", "Unknown")
-        if speaker != "Unknown":
-            return speaker
-    return None
+class UnknownSpeakerRules:
+    """Decides whether an unknown line within the time gap goes to the previous speaker
 
-def is_within_time_gap(segments, current_index, max_gap_seconds):
-    if current_index == 0:
-        return False
-    
-    current_start = segments[current_index].get("start", 0)
-    prev_end = segments[current_index - 1].get("end", current_start)
-    
-    return (current_start - prev_end) <= max_gap_seconds
\ No newline at end of file
+    A line whose neighbours on both sides are the same known speaker is always
+    assigned. Otherwise it is assigned when any enabled rule matches, or
+    unconditionally when assign_by_default is set (the historical behaviour).
+
+    Labels whose speaker_confidence is below min_confidence count as weak: they
+    don't vouch for the speaker around them, and they are overwritten only when
+    the same speaker is on both sides. The text rules are for lines without any
+    label.
+    """
+
+    def __init__(self, assign_by_default=True, short_text_chars=10, filler_words=None, continuation_words=None,
+                 min_confidence=0.5):
+        self.assign_by_default = assign_by_default
+        self.min_confidence = min_confidence
+        self.short_text_chars = short_text_chars
+        self.filler_words = FILLER_WORDS if filler_words is None else set(filler_words)
+        self.continuation_words = CONTINUATION_WORDS if continuation_words is None else set(continuation_words)
+
+    def allows(self, text):
+        if self.assign_by_default:
+            return True
+        text = text.strip().lower()
+        if self.short_text_chars and len(text) <= self.short_text_chars:
+            return True
+        if text.strip(".,!?") in self.filler_words:
+            return True
+        words = text.split()
+        return bool(words) and words[0].strip(".,!?") in self.continuation_words
+
+def resolve_unknown(transcript, max_gap_seconds=5.0, look_ahead=2, rules=None, words=False):
+    """Assign unknown speakers in a Transcript's segment (or word) columns; returns how many were assigned
+
+    Every decision depends only on the original labels, so the whole pass is a
+    handful of array operations; only the text rules look at individual lines.
+    """
+    rules = rules or UnknownSpeakerRules()
+    if words:
+        start, end, speaker, confidence = transcript.word_start, transcript.word_end, transcript.word_speaker, transcript.word_confidence
+        text = transcript.word_text
+    else:
+        start, end, speaker, confidence = transcript.start, transcript.end, transcript.speaker, transcript.confidence
+        text = transcript.text
+    count = len(speaker)
+    if count < 2:
+        return 0
+
+    # A missing confidence (NaN) compares False, so unscored labels are never weak.
+    weak = confidence < rules.min_confidence
+    unknown = (speaker == NO_SPEAKER) | (speaker == transcript.speaker_id(UNKNOWN)) | weak
+    index = np.arange(count)
+    # Nearest known index at or before / at or after each item.
+    previous_known = np.maximum.accumulate(np.where(unknown, -1, index))
+    next_known = np.minimum.accumulate(np.where(unknown, count, index)[::-1])[::-1]
+
+    # Items without timings count as starting at 0 and as following their predecessor directly.
+    current_start = np.nan_to_num(start, nan=0.0)
+    previous_end = np.empty(count)
+    previous_end[0] = current_start[0]
+    previous_end[1:] = np.where(np.isnan(end[:-1]), current_start[1:], end[:-1])
+
+    candidate = unknown & (previous_known >= 0) & (current_start - previous_end <= max_gap_seconds)
+    candidate[0] = False
+    previous_speaker = speaker[np.maximum(previous_known, 0)]
+    has_next = (next_known < count) & (next_known - index <= look_ahead)
+    surrounded = has_next & (speaker[np.minimum(next_known, count - 1)] == previous_speaker)
+
+    assign = candidate & surrounded
+    by_rule = candidate & ~surrounded & ~weak
+    if rules.assign_by_default:
+        assign |= by_rule
+    else:
+        for i in np.flatnonzero(by_rule):
+            assign[i] = rules.allows(text(i))
+    # A weak label that already names the surrounding speaker is left alone.
+    assign &= ~(weak & (speaker == previous_speaker))
+
+    speaker[assign] = previous_speaker[assign]
+    confidence[assign] = np.nan
+    return int(assign.sum())
+
+def handle_unknown_speakers(transcript, max_gap_seconds=5.0, look_ahead=2, rules=None, words=True):
+    assigned = resolve_unknown(transcript, max_gap_seconds, look_ahead, rules)
+    print(f"[handle_unknown_speakers] Assigned {assigned} unknown segments.")
+    if words:
+        assigned = resolve_unknown(transcript, max_gap_seconds, look_ahead, rules, words=True)
+        print(f"[handle_unknown_speakers] Assigned {assigned} unknown words.")
+    return transcript
@@ -0,0 +1,127 @@
+import re
+import time
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+frame_s = 0.03
+margin_db = 12.0
+min_threshold_db = -55.0
+max_threshold_db = -35.0
+min_silence_s = 0.5
+min_speech_s = 0.2
+speech_pad_s = 0.3
+skip_silence_s = 10.0
+overlap_s = 2.0
+
+def frame_energy(source, window_s=60):
+    """Per-frame energy in dB, computed one window at a time"""
+    frame_len = int(frame_s * SAMPLE_RATE)
+    window_len = int(window_s / frame_s) * frame_len
+    energies = []
+    for start in range(0, len(source), window_len):
+        window = np.asarray(source.samples[start:start + window_len], dtype=np.float32)
+        frames = len(window) // frame_len
+        if frames == 0:
+            continue
+        window = window[:frames * frame_len].reshape(frames, frame_len)
+        energies.append(10 * np.log10(np.mean(window * window, axis=1) + 1e-10))
+    if not energies:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(energies)
+
+def speech_regions(energy_db):
+    if len(energy_db) == 0:
+        return []
+    noise_floor = np.percentile(energy_db, 10)
+    # Capped so a recording with no real silence is treated as all speech
+    # rather than all silence.
+    threshold = min(max(noise_floor + margin_db, min_threshold_db), max_threshold_db)
+    mask = np.concatenate(([False], energy_db > threshold, [False]))
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8)))
+    starts = edges[0::2] * frame_s
+    ends = edges[1::2] * frame_s
+    if len(starts) == 0:
+        return []
+
+    # Bridge short pauses, then drop blips too short to be words.
+    keep = np.concatenate(([True], (starts[1:] - ends[:-1]) >= min_silence_s))
+    merged_starts = starts[keep]
+    merged_ends = np.maximum.reduceat(ends, np.flatnonzero(keep))
+    long_enough = (merged_ends - merged_starts) >= min_speech_s
+    duration = len(energy_db) * frame_s
+    return [
+        (max(0.0, float(s) - speech_pad_s), min(duration, float(e) + speech_pad_s))
+        for s, e in zip(merged_starts[long_enough], merged_ends[long_enough])
+    ]
+
+def plan_chunks(regions, chunk_length_s=300):
+    """Group speech regions into chunks whose boundaries fall in silence"""
+    chunks = []
+    chunk_start = None
+    chunk_end = None
+    for start, end in regions:
+        if chunk_start is not None:
+            gap = start - chunk_end
+            if gap >= skip_silence_s or end - chunk_start > chunk_length_s:
+                chunks.append((chunk_start, chunk_end))
+                chunk_start = None
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+        # Continuous speech longer than a chunk has no silence to cut in, so
+        # fall back to fixed cuts that overlap and are stitched afterwards.
+        while chunk_end - chunk_start > chunk_length_s:
+            cut = chunk_start + chunk_length_s
+            chunks.append((chunk_start, cut + overlap_s / 2))
+            chunk_start = cut - overlap_s / 2
+    if chunk_start is not None:
+        chunks.append((chunk_start, chunk_end))
+    return chunks
+
+def vad_chunks(source, chunk_length_s=300):
+    start_time = time.time()
+    regions = speech_regions(frame_energy(source))
+    chunks = plan_chunks(regions, chunk_length_s)
+    covered = 0.0
+    prev_end = 0.0
+    for start, end in chunks:
+        covered += end - max(start, prev_end)
+        prev_end = end
+    skipped = source.duration - covered
+    if source.duration > 0:
+        print(f"[vad] {len(regions)} speech regions, skipping {skipped:.1f}s of silence ({skipped / source.duration:.0%}) in {time.time() - start_time:.2f} seconds.")
+    return chunks
+
+def _normalize(text):
+    return re.sub(r"[^\w\s]", "", text).strip().lower()
+
+def stitch_chunk(chunks, idx, segments, previous=None):
+    """The segments chunk idx owns, minus repeats of previous (the last segment kept so far)"""
+    own_start = float("-inf")
+    own_end = float("inf")
+    start, end = chunks[idx]
+    if idx > 0 and chunks[idx - 1][1] > start:
+        own_start = (chunks[idx - 1][1] + start) / 2
+    if idx + 1 < len(chunks) and chunks[idx + 1][0] < end:
+        own_end = (chunks[idx + 1][0] + end) / 2
+    kept = []
+    for segment in segments:
+        midpoint = (segment["start"] + segment["end"]) / 2
+        if not own_start <= midpoint < own_end:
+            continue
+        if previous is not None:
+            if (segment["start"] < previous["end"] and
+                    _normalize(segment.get("text", "")) == _normalize(previous.get("text", ""))):
+                continue
+        kept.append(segment)
+        previous = segment
+    return kept
+
+def stitch_segments(chunks, chunk_segments):
+    """Concatenate per-chunk segments, keeping only one copy of anything in an overlap"""
+    all_segments = []
+    for idx in sorted(chunk_segments):
+        all_segments.extend(stitch_chunk(chunks, idx, chunk_segments[idx], all_segments[-1] if all_segments else None))
+    return all_segments